@@ -1,23 +1,20 @@
 import os
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
 
 from dotenv import load_dotenv
-from datetime import datetime
-import re
-import collections
 
-from flask import Flask, render_template, flash, redirect, session, g, url_for, jsonify
+from flask import Flask, render_template, flash, redirect, session, g, url_for, jsonify, abort
 from flask_login import LoginManager, login_user, logout_user, login_required 
 from sqlalchemy.exc import IntegrityError
 
-import plotly.graph_objects as go
-import plotly.express as px
-import pandas as pd
-from collections import Counter
-
 from forms import UserAddForm, LoginForm, UserEditForm
-from models import db, connect_db, User, Songs, UserFavoriteDashboards
+from models import db, connect_db, User, UserFavoriteDashboards
+from charts import figure_cache, figure_html, get_figure, get_figures
+from snapshots import invalidate_snapshot
+from stats import rebuild_user_stats
+from executors import in_build_process
+from jobs import make_job_queue
+import migrations
+import ingest  # registers the ingestion jobs
 
 import dash
 from dash import dcc
@@ -27,13 +24,17 @@ from dash.dependencies import Input, Output, State
 
 load_dotenv()
 
-client_id = os.getenv("CLIENT_ID")
-client_secret = os.getenv("CLIENT_SECRET")
-
 CURR_USER_KEY = "curr_user"
+
 SPOTIFY_TOKEN_KEY = 'spotify_token'
 TOKEN_INFO_KEY = 'token_info'
 
+# Viz keys of the charts on /dashboard
+DASHBOARD_VIZ = [
+    'energy_loudness', 'popularity_loudness', 'songs_per_year', 'top_10_artists', 'genres', 'heatmap',
+    'popularity_histogram', 'danceability_energy', 'popularity_over_time', 'loudness_by_genre'
+]
+
 app = Flask(__name__)
 app.app_context().push()
 
@@ -52,7 +53,34 @@ app.config['ERROR_404_HELP'] = False
 
 connect_db(app)
 
-db.create_all()
+if in_build_process():
+    # A figure-build process re-importing this module as its __main__, it only runs chart builders
+    job_queue = None
+else:
+    db.create_all()
+    job_queue = make_job_queue(app)
+
+
+@app.cli.command('upgrade-db')
+def upgrade_db():
+    """Applies schema changes to tables created by an older version of the models."""
+    for name in migrations.upgrade():
+        print(f"Applied {name}")
+
+
+@app.cli.command('backfill-release-dates')
+def backfill_release_dates():
+    """Parses the release dates of tracks cataloged before the release year/date columns existed."""
+    print(f"Updated {ingest.backfill_release_dates()} tracks")
+
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats():
+    """Recomputes every user's user_stats rollup from their library."""
+    for user in User.query.all():
+        rebuild_user_stats(user.user_id)
+        db.session.commit()
+        print(f"Rebuilt stats for {user.username}")
 
 dash_app = dash.Dash(__name__, server=app, url_base_pathname='/dash/')
 dash_app.config.suppress_callback_exceptions = True
@@ -180,97 +208,23 @@ def homepage():
 @app.route('/gettracks')
 @login_required
 def gettracks():
-    """Spotify API pull using the username to pull publis playlist data."""
-    user = User.query.get(session[CURR_USER_KEY])
-    auth_manager = SpotifyClientCredentials(client_id, client_secret)
-    sp = spotipy.Spotify(auth_manager=auth_manager)
-    playlists = sp.user_playlists(user.username)
-
-    # Collect unique Spotify IDs of existing songs
-    existing_spotify_ids_subquery = db.session.query(Songs.spotify_id).filter(Songs.user_id == user.user_id).subquery()
-    existing_spotify_ids = {row[0] for row in db.session.query(existing_spotify_ids_subquery).with_entities(existing_spotify_ids_subquery.c.spotify_id).all()}
-
-    # Collect data for new songs
-    songs_to_add = []
-    track_ids = []
-
-    for playlist in playlists['items']:
-        if playlist['owner']['id'] == user.username:
-            playlist_id = playlist['id']
-            results = sp.playlist(playlist_id, fields="tracks,next")
-            tracks = results['tracks']
-
-            while tracks:
-                for item in tracks['items']:
-                    track = item['track']
-                    spotify_id = track['id']
-
-                    if not spotify_id or spotify_id in existing_spotify_ids:  # checks if the song is already in the db or if the spotify id is not there (had an error with that)
-                        continue
-
-                    track_ids.append(spotify_id)
-                    audio_features = sp.audio_features(track_ids)
-
-                    for audio_feature in audio_features:
-                        release_date = sp.album(track['album']['id'])['release_date']
-                        artist = sp.artist(track['artists'][0]['uri'])
-                        popularity = artist['popularity']
-                        genres = [re.sub(r'[{}"]', '', genre).strip() for genre in artist['genres'] if genre.strip()]
-                        genres_string = ",".join(genres)
-
-                        track_with_features = {
-                            **track,
-                            **audio_feature,
-                            'release_date': release_date,
-                            'popularity': popularity,
-                            'genres': genres_string
-                        }
-
-                        songs_to_add.append(track_with_features)
-
-                    track_ids = []
-
-                if tracks['next']:
-                    tracks = sp.next(tracks)
-                else:
-                    tracks = None
-
-    # Add new songs to the database
-    songs = [
-        Songs(
-            acousticness=track['acousticness'],
-            album=track['album']['name'],
-            analysis_url=track['analysis_url'],
-            artist=track['artists'][0]['name'],
-            popularity=track['popularity'],
-            danceability=track['danceability'],
-            duration_ms=track['duration_ms'],
-            energy=track['energy'],
-            spotify_id=track['id'],
-            instrumentalness=track['instrumentalness'],
-            key=track['key'],
-            liveness=track['liveness'],
-            loudness=track['loudness'],
-            mode=track['mode'],
-            name=track['name'],
-            release_date=track['release_date'],
-            speechiness=track['speechiness'],
-            tempo=track['tempo'],
-            time_signature=track['time_signature'],
-            track_href=track['track_href'],
-            spotify_type=track['type'],
-            uri=track['uri'],
-            valence=track['valence'],
-            genres=track['genres'],
-            user_id=user.user_id
-        )
-        for track in songs_to_add
-    ]
-
-    db.session.bulk_save_objects(songs)
-    db.session.commit()
-
-    return jsonify({'message': 'Tracks added successfully'})
+    """Queues the Spotify pull of the user's public playlists and returns the job id to poll."""
+    user_id = session[CURR_USER_KEY]
+    job_id = job_queue.enqueue('sync_user_tracks', user_id, owner=user_id)
+
+    return jsonify({'job_id': job_id, 'status_url': url_for('gettracks_status', job_id=job_id)}), 202
+
+
+@app.route('/gettracks/<job_id>')
+@login_required
+def gettracks_status(job_id):
+    """Reports the progress and final result of a queued Spotify pull."""
+    job = job_queue.status(job_id)
+
+    if job is None or job['owner'] != session[CURR_USER_KEY]:
+        return jsonify({'message': 'Job not found'}), 404
+
+    return jsonify({key: job[key] for key in ('id', 'status', 'progress', 'result', 'error', 'enqueued_at', 'started_at', 'finished_at')})
 
 
 @app.route('/dashboard')
@@ -280,22 +234,21 @@ def dashboard():
     user_id = session[CURR_USER_KEY]
     dashboards = UserFavoriteDashboards.query.filter_by(user_id=user_id).all()
     
-    all_songs = Songs.query.filter_by(user_id=user_id).all()
-
-    energy_loudness_plot = create_energy_loudness_plot(all_songs)
-    popularity_loudness_plot = create_popularity_loudness_plot(all_songs)
-    num_songs_per_year_plot = create_num_songs_per_year(all_songs)
-    top_10_artists_plot = create_top_artists_plot(all_songs)
-    genres_plot = create_genres_plot(all_songs)
-    heatmap_plot = create_heatmap_plot(all_songs)
-    histo_popularity_plot = create_histo_popularity(all_songs)
-    danceability_energy_plot = create_danceability_energy_plot(all_songs)
-    popularity_over_time_plot = create_populartity_over_time_plot(all_songs)
-    loudness_by_genre_plot = create_loudness_by_genre_plot(all_songs)
+    figures = get_figures(DASHBOARD_VIZ, user_id, render=figure_html)
     
-    return render_template('dashboard.html', dashboards=dashboards, energy_loudness_plot=energy_loudness_plot.to_html(full_html=True), popularity_loudness_plot=popularity_loudness_plot.to_html(full_html=True), num_songs_per_year_plot=num_songs_per_year_plot.to_html(full_html=True), top_10_artists_plot=top_10_artists_plot.to_html(full_html=True), genres_plot=genres_plot.to_html(full_html=True), heatmap_plot=heatmap_plot.to_html(full_html=True), histo_popularity_plot=histo_popularity_plot.to_html(full_html=True), danceability_energy_plot=danceability_energy_plot.to_html(full_html=True), popularity_over_time_plot=popularity_over_time_plot.to_html(full_html=True), loudness_by_genre_plot=loudness_by_genre_plot.to_html(full_html=True))
+    return render_template('dashboard.html', dashboards=dashboards, energy_loudness_plot=figures['energy_loudness'], popularity_loudness_plot=figures['popularity_loudness'], num_songs_per_year_plot=figures['songs_per_year'], top_10_artists_plot=figures['top_10_artists'], genres_plot=figures['genres'], heatmap_plot=figures['heatmap'], histo_popularity_plot=figures['popularity_histogram'], danceability_energy_plot=figures['danceability_energy'], popularity_over_time_plot=figures['popularity_over_time'], loudness_by_genre_plot=figures['loudness_by_genre'])
  
  
+@app.route('/figure-cache')
+@login_required
+def figure_cache_stats():
+    """Hit/miss counters of the figure cache, for sizing FIGURE_CACHE_SIZE. They cover every user, so only served in debug mode."""
+    if not app.debug:
+        abort(404)
+
+    return jsonify(figure_cache().as_dict())
+
+
 @app.route('/dash')
 @login_required
 def dash_route():
@@ -316,661 +269,53 @@ def saved_dash_route(dash_id):
     return render_template('saveddash.html', dashboards=dashboards, content=dash_app.index())
 
     
-# Viz Creation
-def create_energy_loudness_plot(songs):
-    song_data = []
-    for song in songs:
-        song_data.append({
-            'name': song.name,
-            'energy': song.energy,
-            'loudness': song.loudness
-        })
-    
-    # Create the regression plot using Plotly Express
-    fig = px.scatter(
-        song_data, 
-        x=[song['energy'] for song in song_data],
-        y=[song['loudness'] for song in song_data],
-        trendline='ols',
-        color='energy',
-        color_continuous_scale='viridis'
-    )
-    fig.update_traces(
-        hovertemplate="<b>Name:</b> %{text}<br>"
-                      "<b>Energy:</b> %{x}<br>"
-                      "<b>Loudness:</b> %{y}",
-        text=[song['name'] for song in song_data]
-    )
-    fig.update_layout(
-        title="Energy vs Loudness",
-        xaxis_title="Energy",
-        yaxis_title="Loudness",
-        template='plotly_dark'
-    )
-    
-    return fig
-
-
-def create_popularity_loudness_plot(songs):
-    song_data = []
-    for song in songs:
-        song_data.append({
-            'name': song.name,
-            'popularity': song.popularity,
-            'loudness': song.loudness
-        })
-    
-    # Create the regression plot using Plotly Express
-    fig = px.scatter(
-        song_data,
-        x=[song['popularity'] for song in song_data],
-        y=[song['loudness'] for song in song_data],
-        trendline='ols',
-        color='popularity',  
-        color_continuous_scale='viridis'
-    )
-    fig.update_traces(
-        hovertemplate="<b>Name:</b> %{text}<br>"
-                      "<b>Energy:</b> %{x}<br>"
-                      "<b>Loudness:</b> %{y}",
-        text=[song['name'] for song in song_data]
-    )
-    fig.update_layout(
-        title="Popularity vs Loudness",
-        xaxis_title="Popularity",
-        yaxis_title="Loudness",
-        template='plotly_dark'
-    )
-    
-    return fig
-
-
-def create_num_songs_per_year(songs):
-    song_data = []
-    for song in songs:
-        release_date = song.release_date
-
-        if len(release_date) == 7:
-            year = int(release_date[:4])
-        
-        elif len(release_date) == 4:
-            year = int(release_date)
-        else:
-            year = datetime.strptime(release_date, "%Y-%m-%d").year
-        
-        song_data.append(year)
-        count_per_year = dict(collections.Counter(song_data))
-    
-    # Create the histogram plot using Plotly Express
-    fig = go.Figure(data=go.Histogram(
-        x=list(count_per_year.keys()),
-        hovertext=list(count_per_year.values()),
-        hovertemplate="Count: %{hovertext}<br>Year: %{x}",
-        marker=dict(color='rgb(42, 120, 142)')
-    ))
-    
-    fig.update_layout(
-        title="Number of Songs per Year",
-        xaxis_title="Year",
-        yaxis_title="Count",
-        template='plotly_dark'
-    )
-    return fig
-
-
-def create_top_artists_plot(songs):
-    artist_counts = Counter(song.artist for song in songs)
-    top_10_artists = artist_counts.most_common(10)
-    
-    # Create the bar plot using Plotly Express
-    fig = go.Figure(data=go.Bar(
-        x=[artist for artist, count in top_10_artists],
-        y=[count for artist, count in top_10_artists],
-        marker=dict(color='rgb(40, 168, 131)')
-    ))
-    
-    fig.update_layout(
-        title="Top 10 Artists",
-        xaxis_title="Artist",
-        yaxis_title="Count",
-        template='plotly_dark'
-    )
-    
-    return fig
-
-
-def create_genres_plot(songs):
-    genre_counts = Counter()
-
-    # Extract genre strings from each song and count their occurrences
-    for song in songs:
-        genres = song.genres.split(",")
-        genre_counts.update(genres)
-
-    # Select the top 10 most common genres
-    top_10_genres = genre_counts.most_common(10)
-
-    # Create the treemap chart using Plotly Express
-    labels = [genre for genre, count in top_10_genres]
-    values = [count for genre, count in top_10_genres]
-
-    fig = go.Figure(go.Treemap(
-        labels=labels,
-        parents=[""] * len(labels),
-        values=values,
-        texttemplate="%{label}<br>Count: %{value}",
-        textinfo="label+value+percent parent",
-        marker=dict(
-            colorscale="Viridis",
-            colors=values,
-            showscale=True
-        )
-    ))
-
-    fig.update_layout(
-        title="Top 10 Genres (Treemap)",
-        margin=dict(l=0, r=0, t=30, b=0),
-        template='plotly_dark'
-    )
-    
-    return fig
-
-
-def create_heatmap_plot(songs):
-    df = pd.DataFrame({
-        'popularity': [song.popularity for song in songs],
-        'danceability': [song.danceability for song in songs],
-        'energy': [song.energy for song in songs],
-        'loudness': [song.loudness for song in songs],
-        'speechiness': [song.speechiness for song in songs],
-        'acousticness': [song.acousticness for song in songs],
-        'instrumentalness': [song.instrumentalness for song in songs],
-        'liveness': [song.liveness for song in songs],
-        'valence': [song.valence for song in songs]
-    })
-
-    # Compute the correlation matrix
-    corr = df.corr()
-
-    # Create the heatmap trace
-    data = go.Heatmap(
-        z=corr.values,
-        x=corr.columns,
-        y=corr.index,
-        colorscale='viridis'
-    )
-
-    # Create the annotations
-    annotations = []
-    for i, row in enumerate(corr.values):
-        for j, value in enumerate(row):
-            annotations.append(dict(
-                x=corr.columns[j],
-                y=corr.index[i],
-                text=f'{value:.2f}',
-                showarrow=False
-            ))
-
-    # Create the layout
-    layout = go.Layout(
-        title="Correlation Heatmap Between Variables",
-        xaxis=dict(title='Features'),
-        yaxis=dict(title='Features'),
-        annotations=annotations,
-        template='plotly_dark'
-    )
-
-    # Create the figure
-    fig = go.Figure(data=data, layout=layout)
-
-    return fig
-
-
-def create_histo_popularity(songs):
-    popularity_values = [song.popularity for song in songs]
-
-    # Create the histogram
-    fig = go.Figure(data=go.Histogram(x=popularity_values))
-    
-    fig.update_layout(
-        title="Popularity Distribution", 
-        xaxis_title="Popularity", 
-        yaxis_title="Count",
-        template='plotly_dark'
-    )
-
-    return fig
-        
-
-def create_danceability_energy_plot(songs):
-    song_data = []
-    for song in songs:
-        song_data.append({
-            'name': song.name,
-            'danceability': song.danceability,
-            'energy': song.energy
-        })
-    
-    # Create the regression plot using Plotly Express
-    fig = px.scatter(
-        song_data, 
-        x=[song['danceability'] for song in song_data],
-        y=[song['energy'] for song in song_data],
-        trendline='ols',
-        color='energy',
-        color_continuous_scale='viridis'
-    )
-    fig.update_traces(
-        hovertemplate="<b>Name:</b> %{text}<br>"
-                      "<b>Danceability:</b> %{x}<br>"
-                      "<b>Energy:</b> %{y}",
-        text=[song['name'] for song in song_data]
-    )
-    fig.update_layout(
-        title="Dancibility vs Energy",
-        xaxis_title="Danceability",
-        yaxis_title="Energy",
-        template='plotly_dark'
-    )
-    
-    return fig
-
-
-def create_populartity_over_time_plot(songs):
-    df_songs = pd.DataFrame({
-        'release_date': [song.release_date for song in songs],
-        'popularity': [song.popularity for song in songs]
-    })
-
-    df_songs['release_date'] = pd.to_datetime(df_songs['release_date'])
-
-    # Group songs by release date and calculate average popularity
-    release_date_groups = df_songs.groupby(['release_date'])['popularity'].mean().reset_index()
-
-    # Create the line chart
-    fig = px.line(
-        release_date_groups, 
-        x="release_date", 
-        y="popularity",
-        color_discrete_sequence=px.colors.qualitative.Dark2
-    )
-
-    fig.update_layout(
-        title="Popularity Over Time", 
-        xaxis_title="Date", 
-        yaxis_title="Popularity",
-        template='plotly_dark'
-    )
-
-    return fig
-
-
-def create_loudness_by_genre_plot(songs):
-    song_data = []
-    
-    for song in songs:
-        genres = song.genres.split(",")
-        for genre in genres:
-            song_data.append({
-                'genre': genre,
-                'loudness': song.loudness
-            })
-    
-    df = pd.DataFrame(song_data)
-    # Create box and whisker chart
-    fig = px.box(
-        df, 
-        x='genre', 
-        y='loudness', 
-        points="all",
-        color_discrete_sequence=px.colors.qualitative.D3
-    )
-
-    fig.update_layout(
-        title="Loudness by Genre", 
-        xaxis_title="Genres", 
-        yaxis_title="Loudness",
-        template='plotly_dark'
-    )
-
-    return fig
-    
-    
-def total_artists(songs):
-    artist_count = len(set(song.artist for song in songs))
-    # Total artist count KPI
-    fig = go.Figure(go.Indicator(
-        mode="number",
-        value=artist_count,
-        title={'text': 'Artist Count'}
-        ))
-    
-    fig.update_layout(template='plotly_dark', height=225)
-    
-    return fig
-
-
-def total_songs(songs):
-    song_count = len(set(song.name for song in songs))
-    # Total song count KPI
-    fig = go.Figure(go.Indicator(
-        mode="number",
-        value=song_count,
-        title={'text': 'Song Count'}
-    ))
-    
-    fig.update_layout(template='plotly_dark', height=225)
-    
-    return fig
-
-
-def total_genres(songs):
-    song_data = []
-    
-    for song in songs:
-        genres = song.genres.split(",")
-        for genre in genres:
-            song_data.append({
-                'genre': genre
-            })
-    genre_count = len(set(song['genre'] for song in song_data))
-    # Total genre count KPI
-    fig = go.Figure(go.Indicator(
-        mode="number",
-        value=genre_count,
-        title={'text': 'Genre Count'}
-    ))
-    
-    fig.update_layout(template='plotly_dark', height=225)
-    
-    return fig
-
+def viz_graph(selected_viz):
+    """Builds only the selected viz for the logged in user, nothing is shown when no viz is selected."""
+    figure = get_figure(selected_viz, session[CURR_USER_KEY])
+    if figure is None:
+        return None
 
-def total_albums(songs):
-    album_count = len(set(song.album for song in songs))
-    # Total album count KPI
-    fig = go.Figure(go.Indicator(
-        mode="number",
-        value=album_count,
-        title={'text': 'Album Count'}
-    ))
-    
-    fig.update_layout(template='plotly_dark', height=225)
-    
-    return fig
+    return html.Div(dcc.Graph(figure=figure))
 
 
 @dash_app.callback(Output('dash-container1', 'children'), [Input('viz-dropdown1', 'value')])
 def update_dashboard_1(selected_viz):
-    user_id = session[CURR_USER_KEY]
-    all_songs = Songs.query.filter_by(user_id=user_id).all()
-
-    energy_loudness_plot = create_energy_loudness_plot(all_songs)
-    popularity_loudness_plot = create_popularity_loudness_plot(all_songs)
-    num_songs_per_year_plot = create_num_songs_per_year(all_songs)
-    top_10_artists_plot = create_top_artists_plot(all_songs)
-    genres_plot = create_genres_plot(all_songs)
-    heatmap_plot = create_heatmap_plot(all_songs)
-    histo_popularity_plot = create_histo_popularity(all_songs)
-    danceability_energy_plot = create_danceability_energy_plot(all_songs)
-    popularity_over_time_plot = create_populartity_over_time_plot(all_songs)
-    loudness_by_genre_plot = create_loudness_by_genre_plot(all_songs)
-    
-    # Dropdown selection that displays the selected viz
-    if selected_viz == 'energy_loudness':
-        return html.Div(dcc.Graph(figure=energy_loudness_plot))
-    elif selected_viz == 'popularity_loudness':
-        return html.Div(dcc.Graph(figure=popularity_loudness_plot))
-    elif selected_viz == 'songs_per_year':
-        return html.Div(dcc.Graph(figure=num_songs_per_year_plot))
-    elif selected_viz == 'top_10_artists':
-        return html.Div(dcc.Graph(figure=top_10_artists_plot))
-    elif selected_viz == 'genres':
-        return html.Div(dcc.Graph(figure=genres_plot))
-    elif selected_viz == 'heatmap':
-        return html.Div(dcc.Graph(figure=heatmap_plot))
-    elif selected_viz == 'popularity_histogram':
-        return html.Div(dcc.Graph(figure=histo_popularity_plot))
-    elif selected_viz == 'danceability_energy':
-        return html.Div(dcc.Graph(figure=danceability_energy_plot))
-    elif selected_viz == 'popularity_over_time':
-        return html.Div(dcc.Graph(figure=popularity_over_time_plot))
-    elif selected_viz == 'loudness_by_genre':
-        return html.Div(dcc.Graph(figure=loudness_by_genre_plot))
-    elif selected_viz == 'none':
-        return None
-    
-    # Default case if no visualization is selected
-    return None
+    return viz_graph(selected_viz)
 
 
 @dash_app.callback(Output('dash-container2', 'children'), [Input('viz-dropdown2', 'value')])
 def update_dashboard_2(selected_viz):
-    user_id = session[CURR_USER_KEY]
-    all_songs = Songs.query.filter_by(user_id=user_id).all()
-
-    energy_loudness_plot = create_energy_loudness_plot(all_songs)
-    popularity_loudness_plot = create_popularity_loudness_plot(all_songs)
-    num_songs_per_year_plot = create_num_songs_per_year(all_songs)
-    top_10_artists_plot = create_top_artists_plot(all_songs)
-    genres_plot = create_genres_plot(all_songs)
-    heatmap_plot = create_heatmap_plot(all_songs)
-    histo_popularity_plot = create_histo_popularity(all_songs)
-    danceability_energy_plot = create_danceability_energy_plot(all_songs)
-    popularity_over_time_plot = create_populartity_over_time_plot(all_songs)
-    loudness_by_genre_plot = create_loudness_by_genre_plot(all_songs)
-    # Dropdown selection that displays the selected viz
-    if selected_viz == 'energy_loudness':
-        return html.Div(dcc.Graph(figure=energy_loudness_plot))
-    elif selected_viz == 'popularity_loudness':
-        return html.Div(dcc.Graph(figure=popularity_loudness_plot))
-    elif selected_viz == 'songs_per_year':
-        return html.Div(dcc.Graph(figure=num_songs_per_year_plot))
-    elif selected_viz == 'top_10_artists':
-        return html.Div(dcc.Graph(figure=top_10_artists_plot))
-    elif selected_viz == 'genres':
-        return html.Div(dcc.Graph(figure=genres_plot))
-    elif selected_viz == 'heatmap':
-        return html.Div(dcc.Graph(figure=heatmap_plot))
-    elif selected_viz == 'popularity_histogram':
-        return html.Div(dcc.Graph(figure=histo_popularity_plot))
-    elif selected_viz == 'danceability_energy':
-        return html.Div(dcc.Graph(figure=danceability_energy_plot))
-    elif selected_viz == 'popularity_over_time':
-        return html.Div(dcc.Graph(figure=popularity_over_time_plot))
-    elif selected_viz == 'loudness_by_genre':
-        return html.Div(dcc.Graph(figure=loudness_by_genre_plot))
-    elif selected_viz == 'none':
-        return None
-    
-    # Default case if no visualization is selected
-    return None
+    return viz_graph(selected_viz)
 
 
 @dash_app.callback(Output('dash-container3', 'children'), [Input('viz-dropdown3', 'value')])
 def update_dashboard_3(selected_viz):
-    user_id = session[CURR_USER_KEY]
-    all_songs = Songs.query.filter_by(user_id=user_id).all()
-
-    energy_loudness_plot = create_energy_loudness_plot(all_songs)
-    popularity_loudness_plot = create_popularity_loudness_plot(all_songs)
-    num_songs_per_year_plot = create_num_songs_per_year(all_songs)
-    top_10_artists_plot = create_top_artists_plot(all_songs)
-    genres_plot = create_genres_plot(all_songs)
-    heatmap_plot = create_heatmap_plot(all_songs)
-    histo_popularity_plot = create_histo_popularity(all_songs)
-    danceability_energy_plot = create_danceability_energy_plot(all_songs)
-    popularity_over_time_plot = create_populartity_over_time_plot(all_songs)
-    loudness_by_genre_plot = create_loudness_by_genre_plot(all_songs)
-    # Dropdown selection that displays the selected viz
-    if selected_viz == 'energy_loudness':
-        return html.Div(dcc.Graph(figure=energy_loudness_plot))
-    elif selected_viz == 'popularity_loudness':
-        return html.Div(dcc.Graph(figure=popularity_loudness_plot))
-    elif selected_viz == 'songs_per_year':
-        return html.Div(dcc.Graph(figure=num_songs_per_year_plot))
-    elif selected_viz == 'top_10_artists':
-        return html.Div(dcc.Graph(figure=top_10_artists_plot))
-    elif selected_viz == 'genres':
-        return html.Div(dcc.Graph(figure=genres_plot))
-    elif selected_viz == 'heatmap':
-        return html.Div(dcc.Graph(figure=heatmap_plot))
-    elif selected_viz == 'popularity_histogram':
-        return html.Div(dcc.Graph(figure=histo_popularity_plot))
-    elif selected_viz == 'danceability_energy':
-        return html.Div(dcc.Graph(figure=danceability_energy_plot))
-    elif selected_viz == 'popularity_over_time':
-        return html.Div(dcc.Graph(figure=popularity_over_time_plot))
-    elif selected_viz == 'loudness_by_genre':
-        return html.Div(dcc.Graph(figure=loudness_by_genre_plot))
-    elif selected_viz == 'none':
-        return None
-    
-    # Default case if no visualization is selected
-    return None
+    return viz_graph(selected_viz)
 
 
 @dash_app.callback(Output('dash-container4', 'children'), [Input('viz-dropdown4', 'value')])
 def update_dashboard_4(selected_viz):
-    user_id = session[CURR_USER_KEY]
-    all_songs = Songs.query.filter_by(user_id=user_id).all()
-
-    energy_loudness_plot = create_energy_loudness_plot(all_songs)
-    popularity_loudness_plot = create_popularity_loudness_plot(all_songs)
-    num_songs_per_year_plot = create_num_songs_per_year(all_songs)
-    top_10_artists_plot = create_top_artists_plot(all_songs)
-    genres_plot = create_genres_plot(all_songs)
-    heatmap_plot = create_heatmap_plot(all_songs)
-    histo_popularity_plot = create_histo_popularity(all_songs)
-    danceability_energy_plot = create_danceability_energy_plot(all_songs)
-    popularity_over_time_plot = create_populartity_over_time_plot(all_songs)
-    loudness_by_genre_plot = create_loudness_by_genre_plot(all_songs)
-    # Dropdown selection that displays the selected viz
-    if selected_viz == 'energy_loudness':
-        return html.Div(dcc.Graph(figure=energy_loudness_plot))
-    elif selected_viz == 'popularity_loudness':
-        return html.Div(dcc.Graph(figure=popularity_loudness_plot))
-    elif selected_viz == 'songs_per_year':
-        return html.Div(dcc.Graph(figure=num_songs_per_year_plot))
-    elif selected_viz == 'top_10_artists':
-        return html.Div(dcc.Graph(figure=top_10_artists_plot))
-    elif selected_viz == 'genres':
-        return html.Div(dcc.Graph(figure=genres_plot))
-    elif selected_viz == 'heatmap':
-        return html.Div(dcc.Graph(figure=heatmap_plot))
-    elif selected_viz == 'popularity_histogram':
-        return html.Div(dcc.Graph(figure=histo_popularity_plot))
-    elif selected_viz == 'danceability_energy':
-        return html.Div(dcc.Graph(figure=danceability_energy_plot))
-    elif selected_viz == 'popularity_over_time':
-        return html.Div(dcc.Graph(figure=popularity_over_time_plot))
-    elif selected_viz == 'loudness_by_genre':
-        return html.Div(dcc.Graph(figure=loudness_by_genre_plot))
-    elif selected_viz == 'none':
-        return None
-    
-    # Default case if no visualization is selected
-    return None
+    return viz_graph(selected_viz)
 
 
 @dash_app.callback(Output('dash-container5', 'children'), [Input('viz-dropdown5', 'value')])
 def update_dashboard_5(selected_viz):
-    user_id = session[CURR_USER_KEY]
-    all_songs = Songs.query.filter_by(user_id=user_id).all()
-    
-    artist_count = total_artists(all_songs)
-    song_count = total_songs(all_songs)
-    genre_count = total_genres(all_songs)
-    album_count = total_albums(all_songs)
-    # Dropdown selection that displays the selected viz
-    if selected_viz == 'artist_count':
-        return html.Div(dcc.Graph(figure=artist_count))
-    elif selected_viz == 'song_count':
-        return html.Div(dcc.Graph(figure=song_count))
-    elif selected_viz == 'genre_count':
-        return html.Div(dcc.Graph(figure=genre_count))
-    elif selected_viz == 'album_count':
-        return html.Div(dcc.Graph(figure=album_count))
-    elif selected_viz == 'none':
-        return None
-    
-    # Default case if no visualization is selected
-    return None
+    return viz_graph(selected_viz)
 
 
 @dash_app.callback(Output('dash-container6', 'children'), [Input('viz-dropdown6', 'value')])
 def update_dashboard_6(selected_viz):
-    user_id = session[CURR_USER_KEY]
-    all_songs = Songs.query.filter_by(user_id=user_id).all()
-    
-    artist_count = total_artists(all_songs)
-    song_count = total_songs(all_songs)
-    genre_count = total_genres(all_songs)
-    album_count = total_albums(all_songs)
-    # Dropdown selection that displays the selected viz
-    if selected_viz == 'artist_count':
-        return html.Div(dcc.Graph(figure=artist_count))
-    elif selected_viz == 'song_count':
-        return html.Div(dcc.Graph(figure=song_count))
-    elif selected_viz == 'genre_count':
-        return html.Div(dcc.Graph(figure=genre_count))
-    elif selected_viz == 'album_count':
-        return html.Div(dcc.Graph(figure=album_count))
-    elif selected_viz == 'none':
-        return None
-    
-    # Default case if no visualization is selected
-    return None
+    return viz_graph(selected_viz)
 
 
 @dash_app.callback(Output('dash-container7', 'children'), [Input('viz-dropdown7', 'value')])
 def update_dashboard_7(selected_viz):
-    user_id = session[CURR_USER_KEY]
-    all_songs = Songs.query.filter_by(user_id=user_id).all()
-    
-    artist_count = total_artists(all_songs)
-    song_count = total_songs(all_songs)
-    genre_count = total_genres(all_songs)
-    album_count = total_albums(all_songs)
-    # Dropdown selection that displays the selected viz
-    if selected_viz == 'artist_count':
-        return html.Div(dcc.Graph(figure=artist_count))
-    elif selected_viz == 'song_count':
-        return html.Div(dcc.Graph(figure=song_count))
-    elif selected_viz == 'genre_count':
-        return html.Div(dcc.Graph(figure=genre_count))
-    elif selected_viz == 'album_count':
-        return html.Div(dcc.Graph(figure=album_count))
-    elif selected_viz == 'none':
-        return None
-    
-    # Default case if no visualization is selected
-    return None
+    return viz_graph(selected_viz)
 
 
 @dash_app.callback(Output('dash-container8', 'children'), [Input('viz-dropdown8', 'value')])
 def update_dashboard_8(selected_viz):
-    user_id = session[CURR_USER_KEY]
-    all_songs = Songs.query.filter_by(user_id=user_id).all()
-    
-    artist_count = total_artists(all_songs)
-    song_count = total_songs(all_songs)
-    genre_count = total_genres(all_songs)
-    album_count = total_albums(all_songs)
-    # Dropdown selection that displays the selected viz
-    if selected_viz == 'artist_count':
-        return html.Div(dcc.Graph(figure=artist_count))
-    elif selected_viz == 'song_count':
-        return html.Div(dcc.Graph(figure=song_count))
-    elif selected_viz == 'genre_count':
-        return html.Div(dcc.Graph(figure=genre_count))
-    elif selected_viz == 'album_count':
-        return html.Div(dcc.Graph(figure=album_count))
-    elif selected_viz == 'none':
-        return None
-    
-    # Default case if no visualization is selected
-    return None
+    return viz_graph(selected_viz)
 
 
 def create_dash_application():
@@ -1199,26 +544,10 @@ def create_dash_application():
 
 
 def saved_dash_application(dash_id):
-    """Generated the saved dashboard the user created earlier. Saved data is the names of the different functions that create the viz."""
+    """Generated the saved dashboard the user created earlier. Saved data is the viz keys of charts.VIZ_BUILDERS."""
     user_id = session[CURR_USER_KEY]
     dashboard = UserFavoriteDashboards.query.filter_by(user_id=user_id).filter_by(id=dash_id).first()
-    
-    all_songs = Songs.query.filter_by(user_id=user_id).all()
-    
-    energy_loudness = create_energy_loudness_plot(all_songs)
-    popularity_loudness = create_popularity_loudness_plot(all_songs)
-    songs_per_year = create_num_songs_per_year(all_songs)
-    top_10_artists = create_top_artists_plot(all_songs)
-    genres = create_genres_plot(all_songs)
-    heatmap = create_heatmap_plot(all_songs)
-    popularity_histogram = create_histo_popularity(all_songs)
-    danceability_energy = create_danceability_energy_plot(all_songs)
-    popularity_over_time = create_populartity_over_time_plot(all_songs)
-    loudness_by_genre = create_loudness_by_genre_plot(all_songs)
-    artist_count = total_artists(all_songs)
-    song_count = total_songs(all_songs)
-    genre_count = total_genres(all_songs)
-    album_count = total_albums(all_songs)
+    figures = get_figures([dashboard.kpi_1, dashboard.kpi_2, dashboard.kpi_3, dashboard.kpi_4, dashboard.viz_1, dashboard.viz_2, dashboard.viz_3, dashboard.viz_4], user_id)
     
     # creates the dash layout to display the saved dashboard
     layout = html.Div([
@@ -1231,32 +560,32 @@ def saved_dash_application(dash_id):
             ]),
             html.Div(className='row', id='main', children=[
                 html.Div(className='col-md-3', children=[
-                    dcc.Graph(figure=eval(dashboard.kpi_1) if dashboard.kpi_1 is not None else None)
+                    dcc.Graph(figure=figures[dashboard.kpi_1])
                 ]),
                 html.Div(className='col-md-3', children=[
-                    dcc.Graph(figure=eval(dashboard.kpi_2) if dashboard.kpi_2 is not None else None)
+                    dcc.Graph(figure=figures[dashboard.kpi_2])
                 ]),
                 html.Div(className='col-md-3', children=[
-                    dcc.Graph(figure=eval(dashboard.kpi_3) if dashboard.kpi_3 is not None else None)
+                    dcc.Graph(figure=figures[dashboard.kpi_3])
                 ]),
                 html.Div(className='col-md-3', children=[
-                    dcc.Graph(figure=eval(dashboard.kpi_4) if dashboard.kpi_4 is not None else None)
+                    dcc.Graph(figure=figures[dashboard.kpi_4])
                 ]),
             ]),
             html.Div(className='row', id='main', children=[
                 html.Div(className='col-md-8', children=[
-                    dcc.Graph(figure=eval(dashboard.viz_1) if dashboard.viz_1 is not None else None)
+                    dcc.Graph(figure=figures[dashboard.viz_1])
                 ]),
                 html.Div(className='col-md-4', children=[
-                    dcc.Graph(figure=eval(dashboard.viz_2) if dashboard.viz_2 is not None else None)
+                    dcc.Graph(figure=figures[dashboard.viz_2])
                 ])
             ]),
             html.Div(className='row', children=[
                 html.Div(className='col-md-6', children=[
-                    dcc.Graph(figure=eval(dashboard.viz_3) if dashboard.viz_3 is not None else None)
+                    dcc.Graph(figure=figures[dashboard.viz_3])
                 ]),
                 html.Div(className='col-md-6', children=[
-                    dcc.Graph(figure=eval(dashboard.viz_4) if dashboard.viz_4 is not None else None)
+                    dcc.Graph(figure=figures[dashboard.viz_4])
                 ]),
             ]),
         ]),
@@ -1311,6 +640,8 @@ def delete_user():
     if user.is_authenticated and user.user_id == int(session[CURR_USER_KEY]):  
         db.session.delete(user)
         db.session.commit()
+        invalidate_snapshot(user.user_id)
+        figure_cache().invalidate_user(user.user_id)
         flash('User deleted', 'success')
         logout_user() 
         session.clear() 
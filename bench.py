@@ -0,0 +1,56 @@
+"""Times one ingestion run against recorded Spotify fixtures, no network or credentials needed.
+
+Record fixtures once with SPOTIFY_TRANSPORT=record against the live API, then:
+
+    python bench.py <spotify username>
+
+SPOTIFY_REPLAY_LATENCY, SPOTIFY_REPLAY_429_RATE and SPOTIFY_CONCURRENCY shape the run.
+The sync writes to a throwaway SQLite database.
+"""
+import os
+import sys
+import tempfile
+import time
+
+_, db_path = tempfile.mkstemp(suffix='.db')
+os.environ['DATABASE_URL'] = f"sqlite:///{db_path}"
+os.environ['SPOTIFY_TRANSPORT'] = 'replay'
+os.environ.setdefault('CLIENT_ID', 'replay')  # replay hands out its own token, the credentials are never checked
+os.environ.setdefault('CLIENT_SECRET', 'replay')
+os.environ.pop('REDIS_URL', None)
+os.environ['PRECOMPUTE_FIGURES'] = '0'  # time only the sync, not the figure builds it would queue
+
+from app import app, job_queue  # noqa: E402
+from models import db, User  # noqa: E402
+import spotify  # noqa: E402
+
+
+def main(username):
+    user = User.signup('Bench', 'User', username, f"{username}@example.com", 'password')
+    db.session.commit()
+
+    started = time.perf_counter()
+    job_id = job_queue.enqueue('sync_user_tracks', user.user_id)
+    job_queue.join()
+    elapsed = time.perf_counter() - started
+
+    job = job_queue.status(job_id)
+    if job['status'] != 'finished':
+        sys.exit(f"Sync failed: {job['error']}")
+
+    rows = job['result']['rows_inserted']
+    print(f"rows inserted:  {rows}")
+    print(f"elapsed:        {elapsed:.3f}s ({rows / elapsed:.1f} rows/s)")
+    print(f"spotify stats:  {job['result']['spotify']}")
+    print("calls per endpoint:")
+    for path, count in sorted(spotify._client._session.calls.items()):
+        print(f"  {count:6d}  {path}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit(__doc__)
+    try:
+        main(sys.argv[1])
+    finally:
+        os.remove(db_path)
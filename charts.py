@@ -0,0 +1,573 @@
+import json
+import time
+from collections import namedtuple
+from concurrent.futures import TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.express as px
+import plotly.io as pio
+import pandas as pd
+from flask import current_app
+
+from executors import get_process_pool, get_thread_pool, reset_process_pool, run_in_app_context
+from figure_cache import get_figure_cache
+from jobs import register_job
+from models import UserStats
+from regression import add_trendline, fit_features
+from sampling import box_stats, stratified_sample
+from snapshots import snapshot_arrays
+from stats import HEATMAP_FEATURES, correlation_matrix, data_version, top_counts, user_stats, year_histogram
+
+Viz = namedtuple('Viz', ['key', 'build', 'source', 'columns', 'executor'])
+
+# Viz key, as used by the dashboard dropdowns and saved in UserFavoriteDashboards, to its builder and data dependencies
+VIZ_BUILDERS = {}
+
+
+def register_viz(key, source='songs', columns=(), executor='thread'):
+    """Registers a figure builder under a viz key.
+
+    `source` is the data the builder is called with: 'songs' for a dict of the
+    user's snapshot arrays of `columns` (which may name the genre index arrays
+    too), or 'stats' for their UserStats row. A tuple of sources calls the
+    builder with one argument per source. `executor` is 'process' for
+    builders heavy enough to be worth running in a build process.
+    """
+    def decorator(func):
+        VIZ_BUILDERS[key] = Viz(key, func, source, tuple(columns), executor)
+        return func
+    return decorator
+
+
+def load_viz_data(source, columns, user_id):
+    if source == 'stats':
+        return user_stats(user_id)
+    return snapshot_arrays(user_id, *columns)
+
+
+def load_figure_data(viz, user_id):
+    """The arguments the builder of `viz` is called with, one per source."""
+    sources = viz.source if isinstance(viz.source, tuple) else (viz.source,)
+    return [load_viz_data(source, viz.columns, user_id) for source in sources]
+
+
+def figure_json(build, *data):
+    """Builds a figure and serializes it, the unit of work handed to a build process."""
+    return build(*data).to_json()
+
+
+def portable(data):
+    """Viz data as it can be sent to a build process: a UserStats row as a plain namespace, arrays copied out of their memory maps."""
+    if isinstance(data, UserStats):
+        return SimpleNamespace(**{column.name: getattr(data, column.name) for column in UserStats.__table__.columns})
+    if isinstance(data, dict):
+        return {name: np.asarray(values) for name, values in data.items()}
+    return data
+
+
+def build_figure_json(key, user_id, store, deadline=None):
+    """Builds the figure registered under `key` as plotly JSON and passes it to `store`, in a build process for 'process' vizzes when there are any.
+
+    When given a `deadline` (time.monotonic()), a build process is only
+    waited on until then, and TimeoutError is raised so a slow or hung
+    process can't hold a request past it. A build that finishes late is
+    still stored. Without one, the build is waited on until it's done.
+    """
+    viz = VIZ_BUILDERS[key]
+    data = load_figure_data(viz, user_id)
+    process_pool = get_process_pool(current_app.config) if viz.executor == 'process' else None
+    if process_pool is None:
+        figure = figure_json(viz.build, *data)
+        store(figure)
+        return figure
+
+    timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+    try:
+        future = process_pool.submit(run_in_app_context, figure_json, viz.build, *(portable(d) for d in data))
+        future.add_done_callback(lambda done: store(done.result()) if not done.cancelled() and done.exception() is None else None)
+        return future.result(timeout=timeout)
+    except BrokenProcessPool:
+        # A build process died, build this one here and let the next figure start a new pool
+        current_app.logger.exception(f"Build processes failed building {key}")
+        reset_process_pool(process_pool)
+        figure = figure_json(viz.build, *data)
+        store(figure)
+        return figure
+
+
+def figure_cache():
+    return get_figure_cache(current_app.config)
+
+
+def get_figure(key, user_id, version=None, deadline=None):
+    """The figure registered under `key` as a plotly JSON dict, only built when the figure cache has none for the user's data version.
+
+    Pass the `version` from stats.data_version when getting several figures,
+    so it's read once rather than once per figure. See build_figure_json for
+    `deadline`.
+    """
+    if key not in VIZ_BUILDERS:
+        return None
+
+    if version is None:
+        version = data_version(user_id)
+
+    cache = figure_cache()
+    cache_key = (user_id, key, version)
+    figure = cache.get(cache_key)
+    if figure is None:
+        figure = build_figure_json(key, user_id, lambda built: cache.set(cache_key, built), deadline)
+
+    return json.loads(figure)
+
+
+def placeholder_figure(message):
+    """An empty chart showing `message`, served in place of a figure that failed or isn't built yet."""
+    fig = go.Figure()
+    fig.add_annotation(text=message, showarrow=False, xref='paper', yref='paper', x=0.5, y=0.5)
+    fig.update_layout(xaxis=dict(visible=False), yaxis=dict(visible=False), template='plotly_dark')
+    return json.loads(fig.to_json())
+
+
+def get_figures(keys, user_id, render=None):
+    """get_figure for several viz keys at once, fanned out over the build threads, as {key: figure}.
+
+    Each figure is passed through `render` (e.g. figure_html) on its thread
+    too. A chart that fails, or isn't done FIGURE_BUILD_TIMEOUT seconds after
+    the request started, is served as a placeholder; one that timed out keeps
+    building into the figure cache for the next request. So the wait is the
+    slowest chart's rather than the sum of all of them.
+    """
+    app = current_app._get_current_object()
+    render = render or (lambda figure: figure)
+    version = data_version(user_id)
+    deadline = time.monotonic() + app.config['FIGURE_BUILD_TIMEOUT']
+
+    def build(key):
+        with app.app_context():
+            return render(get_figure(key, user_id, version, deadline))
+
+    pool = get_thread_pool(app.config)
+    futures = {key: pool.submit(build, key) for key in keys}
+
+    figures = {}
+    for key, future in futures.items():
+        try:
+            figures[key] = future.result(timeout=max(deadline - time.monotonic(), 0))
+        except TimeoutError:
+            app.logger.warning(f"Building {key} for user {user_id} timed out")
+            figures[key] = render(placeholder_figure("This chart is still being built, reload in a moment"))
+        except Exception:
+            app.logger.exception(f"Building {key} for user {user_id} failed")
+            figures[key] = render(placeholder_figure("This chart couldn't be built"))
+
+    return figures
+
+
+@register_job
+def precompute_figures(progress, user_id):
+    """Builds every registered figure for the user into the figure cache, queued after a sync changes their library.
+
+    Figures already cached for the current data version are skipped, and a
+    dashboard opened before this finishes builds what's missing on demand.
+    A figure that fails is logged and skipped, so it doesn't stop the rest.
+    """
+    progress(figures_total=len(VIZ_BUILDERS), figures_done=0)
+    version = data_version(user_id)
+    failed = []
+
+    for figures_done, key in enumerate(VIZ_BUILDERS, 1):
+        try:
+            get_figure(key, user_id, version)
+        except Exception:
+            current_app.logger.exception(f"Precomputing {key} for user {user_id} failed")
+            failed.append(key)
+        progress(figures_done=figures_done)
+
+    return {'message': 'Figures precomputed', 'figures': len(VIZ_BUILDERS) - len(failed), 'failed': failed}
+
+
+def large_library(size):
+    """Whether a chart of `size` points renders in large-library mode, with WebGL traces and data reduced on the server."""
+    return size > current_app.config['LARGE_LIBRARY_THRESHOLD']
+
+
+def scatter_points(songs, x, y):
+    """The songs a scatter of `x` against `y` plots, and the plotly render mode to draw them with.
+
+    Past LARGE_LIBRARY_THRESHOLD songs only a stratified sample of
+    LARGE_LIBRARY_MAX_POINTS is sent, drawn with WebGL.
+    """
+    if not large_library(len(songs[x])):
+        return songs, 'auto'
+
+    keep = stratified_sample(songs[x], songs[y], current_app.config['LARGE_LIBRARY_MAX_POINTS'])
+    return {name: values[keep] for name, values in songs.items()}, 'webgl'
+
+
+def figure_html(figure):
+    """A standalone HTML page for a figure dict from get_figure."""
+    return pio.to_html(figure, full_html=True, validate=False)
+
+
+@register_viz('energy_loudness', source=('songs', 'stats'), columns=['name', 'energy', 'loudness'], executor='process')
+def create_energy_loudness_plot(songs, stats):
+    points, render_mode = scatter_points(songs, 'energy', 'loudness')
+
+    # Create the regression plot using Plotly Express
+    fig = px.scatter(
+        x=points['energy'],
+        y=points['loudness'],
+        color=points['energy'],
+        labels={'color': 'energy'},
+        color_continuous_scale='viridis',
+        render_mode=render_mode
+    )
+    fig.update_traces(
+        hovertemplate="<b>Name:</b> %{text}<br>"
+                      "<b>Energy:</b> %{x}<br>"
+                      "<b>Loudness:</b> %{y}",
+        text=points['name']
+    )
+    # Least-squares line from the running sums in user_stats, added after the hover text so it keeps its own
+    add_trendline(fig, fit_features(stats, 'energy', 'loudness'), points['energy'], 'energy', 'loudness')
+    fig.update_layout(
+        title="Energy vs Loudness",
+        xaxis_title="Energy",
+        yaxis_title="Loudness",
+        template='plotly_dark'
+    )
+    
+    return fig
+
+
+@register_viz('popularity_loudness', source=('songs', 'stats'), columns=['name', 'popularity', 'loudness'], executor='process')
+def create_popularity_loudness_plot(songs, stats):
+    points, render_mode = scatter_points(songs, 'popularity', 'loudness')
+
+    # Create the regression plot using Plotly Express
+    fig = px.scatter(
+        x=points['popularity'],
+        y=points['loudness'],
+        color=points['popularity'],
+        labels={'color': 'popularity'},
+        color_continuous_scale='viridis',
+        render_mode=render_mode
+    )
+    fig.update_traces(
+        hovertemplate="<b>Name:</b> %{text}<br>"
+                      "<b>Energy:</b> %{x}<br>"
+                      "<b>Loudness:</b> %{y}",
+        text=points['name']
+    )
+    # Least-squares line from the running sums in user_stats, added after the hover text so it keeps its own
+    add_trendline(fig, fit_features(stats, 'popularity', 'loudness'), points['popularity'], 'popularity', 'loudness')
+    fig.update_layout(
+        title="Popularity vs Loudness",
+        xaxis_title="Popularity",
+        yaxis_title="Loudness",
+        template='plotly_dark'
+    )
+    
+    return fig
+
+
+@register_viz('songs_per_year', source='stats')
+def create_num_songs_per_year(stats):
+    count_per_year = year_histogram(stats)
+    
+    fig = go.Figure(data=go.Bar(
+        x=[year for year, count in count_per_year],
+        y=[count for year, count in count_per_year],
+        hovertemplate="Count: %{y}<br>Year: %{x}",
+        marker=dict(color='rgb(42, 120, 142)')
+    ))
+    
+    fig.update_layout(
+        title="Number of Songs per Year",
+        xaxis_title="Year",
+        yaxis_title="Count",
+        template='plotly_dark'
+    )
+    return fig
+
+
+@register_viz('top_10_artists', source='stats')
+def create_top_artists_plot(stats):
+    top_10_artists = top_counts(stats.artist_counts)
+    
+    # Create the bar plot using Plotly Express
+    fig = go.Figure(data=go.Bar(
+        x=[artist for artist, count in top_10_artists],
+        y=[count for artist, count in top_10_artists],
+        marker=dict(color='rgb(40, 168, 131)')
+    ))
+    
+    fig.update_layout(
+        title="Top 10 Artists",
+        xaxis_title="Artist",
+        yaxis_title="Count",
+        template='plotly_dark'
+    )
+    
+    return fig
+
+
+@register_viz('genres', source='stats')
+def create_genres_plot(stats):
+    top_10_genres = top_counts(stats.genre_counts)
+
+    # Create the treemap chart using Plotly Express
+    labels = [genre for genre, count in top_10_genres]
+    values = [count for genre, count in top_10_genres]
+
+    fig = go.Figure(go.Treemap(
+        labels=labels,
+        parents=[""] * len(labels),
+        values=values,
+        texttemplate="%{label}<br>Count: %{value}",
+        textinfo="label+value+percent parent",
+        marker=dict(
+            colorscale="Viridis",
+            colors=values,
+            showscale=True
+        )
+    ))
+
+    fig.update_layout(
+        title="Top 10 Genres (Treemap)",
+        margin=dict(l=0, r=0, t=30, b=0),
+        template='plotly_dark'
+    )
+    
+    return fig
+
+
+@register_viz('heatmap', source='stats')
+def create_heatmap_plot(stats):
+    # Correlation matrix from the running sums in user_stats, no matter how many songs the user has
+    corr = correlation_matrix(stats)
+
+    # Create the heatmap trace, each cell labelled with its correlation
+    data = go.Heatmap(
+        z=corr,
+        x=HEATMAP_FEATURES,
+        y=HEATMAP_FEATURES,
+        texttemplate='%{z:.2f}',
+        colorscale='viridis'
+    )
+
+    # Create the layout
+    layout = go.Layout(
+        title="Correlation Heatmap Between Variables",
+        xaxis=dict(title='Features'),
+        yaxis=dict(title='Features'),
+        template='plotly_dark'
+    )
+
+    # Create the figure
+    fig = go.Figure(data=data, layout=layout)
+
+    return fig
+
+
+@register_viz('popularity_histogram', columns=['popularity'])
+def create_histo_popularity(songs):
+    popularity_values = songs['popularity']
+
+    # Create the histogram
+    fig = go.Figure(data=go.Histogram(x=popularity_values))
+    
+    fig.update_layout(
+        title="Popularity Distribution", 
+        xaxis_title="Popularity", 
+        yaxis_title="Count",
+        template='plotly_dark'
+    )
+
+    return fig
+        
+
+@register_viz('danceability_energy', source=('songs', 'stats'), columns=['name', 'danceability', 'energy'], executor='process')
+def create_danceability_energy_plot(songs, stats):
+    points, render_mode = scatter_points(songs, 'danceability', 'energy')
+
+    # Create the regression plot using Plotly Express
+    fig = px.scatter(
+        x=points['danceability'],
+        y=points['energy'],
+        color=points['energy'],
+        labels={'color': 'energy'},
+        color_continuous_scale='viridis',
+        render_mode=render_mode
+    )
+    fig.update_traces(
+        hovertemplate="<b>Name:</b> %{text}<br>"
+                      "<b>Danceability:</b> %{x}<br>"
+                      "<b>Energy:</b> %{y}",
+        text=points['name']
+    )
+    # Least-squares line from the running sums in user_stats, added after the hover text so it keeps its own
+    add_trendline(fig, fit_features(stats, 'danceability', 'energy'), points['danceability'], 'danceability', 'energy')
+    fig.update_layout(
+        title="Dancibility vs Energy",
+        xaxis_title="Danceability",
+        yaxis_title="Energy",
+        template='plotly_dark'
+    )
+    
+    return fig
+
+
+@register_viz('popularity_over_time', columns=['release_date_parsed', 'popularity'], executor='process')
+def create_populartity_over_time_plot(songs):
+    df_songs = pd.DataFrame({
+        'release_date': songs['release_date_parsed'],
+        'popularity': songs['popularity']
+    })
+
+    # Group songs by release date and calculate average popularity
+    release_date_groups = df_songs.groupby(['release_date'])['popularity'].mean().reset_index()
+
+    # Create the line chart
+    fig = px.line(
+        release_date_groups, 
+        x="release_date", 
+        y="popularity",
+        color_discrete_sequence=px.colors.qualitative.Dark2
+    )
+
+    fig.update_layout(
+        title="Popularity Over Time", 
+        xaxis_title="Date", 
+        yaxis_title="Popularity",
+        template='plotly_dark'
+    )
+
+    return fig
+
+
+@register_viz('loudness_by_genre', columns=['loudness', 'genres', 'genre_offsets', 'genre_rows'], executor='process')
+def create_loudness_by_genre_plot(songs):
+    # The snapshot's genre index lists genres most common first, so the top LOUDNESS_GENRE_LIMIT are its first entries
+    limit = current_app.config['LOUDNESS_GENRE_LIMIT'] or len(songs['genres'])
+    genres = songs['genres'][:limit]
+    offsets = songs['genre_offsets'][:len(genres) + 1]
+    # Rows are grouped by genre, so this is the loudness of every (genre, song) pair in genre order
+    loudness = songs['loudness'][songs['genre_rows'][:offsets[-1]]]
+
+    # Create box and whisker chart
+    fig = genre_box_stats_plot(genres, offsets, loudness)
+    fig.update_layout(
+        title="Loudness by Genre", 
+        xaxis_title="Genres", 
+        yaxis_title="Loudness",
+        template='plotly_dark'
+    )
+
+    return fig
+
+
+def genre_box_stats_plot(genres, offsets, loudness):
+    """Loudness boxes per genre with quartiles and whiskers computed here, instead of shipping every point for plotly to box.
+
+    `loudness` holds each genre's values in turn, genre i's between
+    offsets[i] and offsets[i + 1]. Only the points beyond the whiskers are
+    drawn, and past LARGE_LIBRARY_THRESHOLD of them only a sample of
+    LARGE_LIBRARY_MAX_POINTS, with WebGL.
+    """
+    boxes = {genre: box_stats(loudness[start:end]) for genre, start, end in zip(genres, offsets[:-1], offsets[1:])}
+    boxes = {genre: box for genre, box in boxes.items() if box is not None}
+    genres = list(boxes)
+    color = px.colors.qualitative.D3[0]
+
+    fig = go.Figure(go.Box(
+        x=genres,
+        q1=[boxes[genre]['q1'] for genre in genres],
+        median=[boxes[genre]['median'] for genre in genres],
+        q3=[boxes[genre]['q3'] for genre in genres],
+        lowerfence=[boxes[genre]['lowerfence'] for genre in genres],
+        upperfence=[boxes[genre]['upperfence'] for genre in genres],
+        marker_color=color,
+        showlegend=False
+    ))
+
+    # Outliers of every genre, sampled over genre position and loudness so each genre keeps some
+    outliers = np.array([(i, value) for i, genre in enumerate(genres) for value in boxes[genre]['outliers']]).reshape(-1, 2)
+    scatter = go.Scatter
+    if large_library(len(outliers)):
+        outliers = outliers[stratified_sample(outliers[:, 0], outliers[:, 1], current_app.config['LARGE_LIBRARY_MAX_POINTS'])]
+        scatter = go.Scattergl
+    fig.add_trace(scatter(
+        x=[genres[int(i)] for i in outliers[:, 0]],
+        y=outliers[:, 1],
+        mode='markers',
+        marker=dict(color=color, size=4),
+        name='outliers',
+        showlegend=False
+    ))
+
+    return fig
+
+
+@register_viz('artist_count', source='stats')
+def total_artists(stats):
+    artist_count = len(stats.artist_counts)
+    # Total artist count KPI
+    fig = go.Figure(go.Indicator(
+        mode="number",
+        value=artist_count,
+        title={'text': 'Artist Count'}
+        ))
+    
+    fig.update_layout(template='plotly_dark', height=225)
+    
+    return fig
+
+
+@register_viz('song_count', source='stats')
+def total_songs(stats):
+    song_count = stats.song_count
+    # Total song count KPI
+    fig = go.Figure(go.Indicator(
+        mode="number",
+        value=song_count,
+        title={'text': 'Song Count'}
+    ))
+    
+    fig.update_layout(template='plotly_dark', height=225)
+    
+    return fig
+
+
+@register_viz('genre_count', source='stats')
+def total_genres(stats):
+    genre_count = len(stats.genre_counts)
+    # Total genre count KPI
+    fig = go.Figure(go.Indicator(
+        mode="number",
+        value=genre_count,
+        title={'text': 'Genre Count'}
+    ))
+    
+    fig.update_layout(template='plotly_dark', height=225)
+    
+    return fig
+
+
+@register_viz('album_count', source='stats')
+def total_albums(stats):
+    album_count = len(stats.album_counts)
+    # Total album count KPI
+    fig = go.Figure(go.Indicator(
+        mode="number",
+        value=album_count,
+        title={'text': 'Album Count'}
+    ))
+    
+    fig.update_layout(template='plotly_dark', height=225)
+    
+    return fig
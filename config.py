@@ -1 +1,60 @@
-SECRET_KEY = 'data-viz'
\ No newline at end of file
+import os
+
+SECRET_KEY = os.environ.get('SECRET_KEY', 'data-viz')
+
+# Background jobs (Spotify ingestion) run on redis when REDIS_URL is set, otherwise on an in-process thread
+REDIS_URL = os.environ.get('REDIS_URL')
+JOB_RESULT_TTL = 60 * 60 * 24
+
+# Spotify fetching: worker threads per sync and the request budget shared by all syncs in a process
+SPOTIFY_CONCURRENCY = int(os.environ.get('SPOTIFY_CONCURRENCY', 8))
+SPOTIFY_RATE_LIMIT = float(os.environ.get('SPOTIFY_RATE_LIMIT', 20))
+SPOTIFY_BURST = int(os.environ.get('SPOTIFY_BURST', 20))
+
+# Artist and album metadata is shared across users and refetched from Spotify once it is this old
+METADATA_TTL_DAYS = int(os.environ.get('METADATA_TTL_DAYS', 7))
+
+# Ingestion reads this many playlists at a time and commits new songs in chunks of this many rows
+INGEST_PLAYLIST_WINDOW = int(os.environ.get('INGEST_PLAYLIST_WINDOW', 20))
+INGEST_CHUNK_SIZE = int(os.environ.get('INGEST_CHUNK_SIZE', 500))
+
+# One Spotify client per process: its keep-alive pool holds this many connections and its token is refreshed this many seconds early
+SPOTIFY_POOL_SIZE = int(os.environ.get('SPOTIFY_POOL_SIZE', SPOTIFY_CONCURRENCY))
+SPOTIFY_TOKEN_REFRESH_MARGIN = int(os.environ.get('SPOTIFY_TOKEN_REFRESH_MARGIN', 300))
+
+# Spotify transport: 'live', 'record' (save responses as fixtures) or 'replay' (serve fixtures offline)
+SPOTIFY_TRANSPORT = os.environ.get('SPOTIFY_TRANSPORT', 'live')
+SPOTIFY_FIXTURES_DIR = os.environ.get('SPOTIFY_FIXTURES_DIR', os.path.join(os.path.dirname(__file__), 'fixtures', 'spotify'))
+SPOTIFY_REPLAY_LATENCY = float(os.environ.get('SPOTIFY_REPLAY_LATENCY', 0))
+SPOTIFY_REPLAY_429_RATE = float(os.environ.get('SPOTIFY_REPLAY_429_RATE', 0))
+SPOTIFY_REPLAY_RETRY_AFTER = float(os.environ.get('SPOTIFY_REPLAY_RETRY_AFTER', 1))
+SPOTIFY_REPLAY_SEED = int(os.environ.get('SPOTIFY_REPLAY_SEED', 0))
+
+# Built figures are cached per (user, viz, data version): at most this many, optionally expiring after a TTL in seconds (0 for none)
+# The backend is 'memory' (per process), 'disk' (shared by the workers on a host) or 'redis' (shared by all workers, the default with REDIS_URL)
+FIGURE_CACHE_BACKEND = os.environ.get('FIGURE_CACHE_BACKEND')
+FIGURE_CACHE_SIZE = int(os.environ.get('FIGURE_CACHE_SIZE', 256))
+FIGURE_CACHE_TTL = int(os.environ.get('FIGURE_CACHE_TTL', 0))
+FIGURE_CACHE_DIR = os.environ.get('FIGURE_CACHE_DIR', os.path.join(os.path.dirname(__file__), 'cache', 'figures'))
+
+# After a sync adds songs, queue a job that builds every figure into the cache. With the redis job queue this needs a shared cache backend
+PRECOMPUTE_FIGURES = os.environ.get('PRECOMPUTE_FIGURES', '1') == '1'
+
+# Per-user columnar snapshots of the chart columns are memory-mapped from .npy files under this directory
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', os.path.join(os.path.dirname(__file__), 'cache', 'snapshots'))
+
+# Charts of more points than this switch to large-library mode: WebGL scatters of a stratified sample of at most
+# LARGE_LIBRARY_MAX_POINTS songs, loudness outliers included (the loudness boxes are always computed on the server)
+LARGE_LIBRARY_THRESHOLD = int(os.environ.get('LARGE_LIBRARY_THRESHOLD', 20000))
+LARGE_LIBRARY_MAX_POINTS = int(os.environ.get('LARGE_LIBRARY_MAX_POINTS', 5000))
+
+# Loudness by genre shows only this many of the user's most common genres (0 for all of them)
+LOUDNESS_GENRE_LIMIT = int(os.environ.get('LOUDNESS_GENRE_LIMIT', 20))
+
+# /dashboard builds its figures in parallel: data loads and HTML rendering on FIGURE_BUILD_THREADS threads, the
+# CPU-heavy builders in FIGURE_BUILD_PROCESSES worker processes (by default one per spare core, up to 4; 0 builds them
+# on the threads too). A chart not ready FIGURE_BUILD_TIMEOUT seconds into the request is shown as a placeholder and
+# keeps building into the cache
+FIGURE_BUILD_THREADS = int(os.environ.get('FIGURE_BUILD_THREADS', 10))
+FIGURE_BUILD_PROCESSES = int(os.environ.get('FIGURE_BUILD_PROCESSES', min((os.cpu_count() or 1) - 1, 4)))
+FIGURE_BUILD_TIMEOUT = float(os.environ.get('FIGURE_BUILD_TIMEOUT', 10))
@@ -0,0 +1,81 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from flask import Flask
+
+# Config handed to the build processes, everything a figure builder reads from current_app.config
+PROCESS_CONFIG = ['LARGE_LIBRARY_THRESHOLD', 'LARGE_LIBRARY_MAX_POINTS', 'LOUDNESS_GENRE_LIMIT']
+
+_thread_pool = None
+_process_pool = None
+_pools_lock = threading.Lock()
+_process_app = None
+
+
+def get_thread_pool(config):
+    """The process-wide thread pool of FIGURE_BUILD_THREADS workers, for work that waits on the database, cache or processes."""
+    global _thread_pool
+
+    with _pools_lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(config['FIGURE_BUILD_THREADS'], thread_name_prefix='figure-build')
+
+        return _thread_pool
+
+
+def in_build_process():
+    """Whether this is a spawned build process.
+
+    Spawning re-imports the parent's __main__ module, so under `python app.py`
+    each build process runs app.py's module body again. app.py checks this to
+    skip its startup (creating tables, starting the job queue) there.
+    """
+    return multiprocessing.parent_process() is not None
+
+
+def get_process_pool(config):
+    """The process-wide pool of FIGURE_BUILD_PROCESSES worker processes for CPU-heavy work, or None when set to 0.
+
+    Workers are spawned rather than forked, so they don't inherit the locks
+    and connections of this process's threads. See in_build_process.
+    """
+    global _process_pool
+
+    if not config['FIGURE_BUILD_PROCESSES']:
+        return None
+
+    with _pools_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                config['FIGURE_BUILD_PROCESSES'],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_process,
+                initargs=({key: config[key] for key in PROCESS_CONFIG},)
+            )
+
+        return _process_pool
+
+
+def reset_process_pool(pool):
+    """Drops `pool` if it's still the process pool, e.g. after a worker died, so the next caller starts a fresh one."""
+    global _process_pool
+
+    with _pools_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False)
+
+
+def init_process(config):
+    """Sets up a worker process with a bare app carrying the parent's PROCESS_CONFIG, it has no database."""
+    global _process_app
+
+    _process_app = Flask(__name__)
+    _process_app.config.update(config)
+
+
+def run_in_app_context(func, *args):
+    """Calls `func(*args)` in a worker process, inside its app context so `current_app.config` works."""
+    with _process_app.app_context():
+        return func(*args)
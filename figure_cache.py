@@ -0,0 +1,263 @@
+import glob
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import redis
+
+
+class BaseFigureCache:
+    """Cache of serialized figures and aggregates keyed by (user_id, name, data version).
+
+    `name` is a viz key, or the name of an aggregate. The data version is
+    bumped whenever a sync changes the user's library, so a value built from
+    older data is never served. Setting a newer version drops the older ones
+    of the same name. Backends implement `lookup`, `store`, `invalidate_user`
+    and `size`.
+    """
+
+    def __init__(self, max_entries=256, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        value = self.lookup(key)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.store(key, value)
+
+    def counters(self):
+        return self.hits, self.misses, self.evictions
+
+    def as_dict(self):
+        hits, misses, evictions = self.counters()
+        lookups = hits + misses
+        return {
+            'backend': type(self).__name__,
+            'entries': self.size(),
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'hits': hits,
+            'misses': misses,
+            'evictions': evictions,
+            'hit_rate': round(hits / lookups, 3) if lookups else None
+        }
+
+
+class InProcessFigureCache(BaseFigureCache):
+    """Size-bounded LRU in this process's memory. Each gunicorn worker keeps its own."""
+
+    def __init__(self, max_entries=256, ttl=None):
+        super().__init__(max_entries, ttl)
+        self.entries = OrderedDict()
+
+    def lookup(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if self.ttl and time.monotonic() - entry[1] > self.ttl:
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def store(self, key, value):
+        user_id, name, data_version = key
+
+        with self.lock:
+            for old_key in [k for k in self.entries if k[:2] == (user_id, name) and k[2] != data_version]:
+                del self.entries[old_key]
+
+            self.entries[key] = (value, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id):
+        """Drops every cached value of a user, e.g. when their account is deleted."""
+        with self.lock:
+            for key in [k for k in self.entries if k[0] == user_id]:
+                del self.entries[key]
+
+    def size(self):
+        return len(self.entries)
+
+
+class DiskFigureCache(BaseFigureCache):
+    """Values as files under `path`, shared by every worker process on the host.
+
+    Entries live at `<path>/<user_id>/<name>.<data version>.json`, written to
+    a temporary file and renamed into place. Reads touch the file, so once
+    there are more than `max_entries` files the least recently used are removed.
+    """
+
+    def __init__(self, path, max_entries=256, ttl=None):
+        super().__init__(max_entries, ttl)
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def file_path(self, key):
+        user_id, name, data_version = key
+        return os.path.join(self.path, str(user_id), f"{name}.{data_version}.json")
+
+    def lookup(self, key):
+        path = self.file_path(key)
+        try:
+            if self.ttl and time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path) as f:
+                value = f.read()
+            os.utime(path, (time.time(), os.path.getmtime(path)))
+        except FileNotFoundError:
+            return None
+
+        return value
+
+    def store(self, key, value):
+        user_id, name, data_version = key
+        path = self.file_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        for old_path in glob.glob(os.path.join(self.path, str(user_id), f"{glob.escape(name)}.*.json")):
+            if old_path != path:
+                self.remove(old_path)
+
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(value)
+        os.replace(tmp_path, path)
+
+        self.evict()
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def files(self):
+        return glob.glob(os.path.join(self.path, '*', '*.json'))
+
+    def evict(self):
+        files = self.files()
+        if len(files) <= self.max_entries:
+            return
+
+        def last_used(path):
+            try:
+                return os.path.getatime(path)
+            except FileNotFoundError:
+                return 0
+
+        for path in sorted(files, key=last_used)[:len(files) - self.max_entries]:
+            self.remove(path)
+            with self.lock:
+                self.evictions += 1
+
+    def invalidate_user(self, user_id):
+        for path in glob.glob(os.path.join(self.path, str(user_id), '*.json')):
+            self.remove(path)
+
+    def size(self):
+        return len(self.files())
+
+
+class RedisFigureCache(BaseFigureCache):
+    """Values in redis, shared by every worker on every host.
+
+    Entries expire after `ttl` seconds when set. Redis has no per-prefix size
+    limit, so bound memory with the server's maxmemory and an allkeys-lru
+    policy. Hit and miss counters are kept in redis too, so they cover all workers.
+    """
+
+    def __init__(self, url, max_entries=256, ttl=None, name='datalens'):
+        super().__init__(max_entries, ttl)
+        self.redis = redis.Redis.from_url(url)
+        self.name = name
+
+    def key(self, key):
+        user_id, name, data_version = key
+        return f"{self.name}:figure:{user_id}:{name}:{data_version}"
+
+    def user_key(self, user_id):
+        return f"{self.name}:figures:{user_id}"
+
+    def lookup(self, key):
+        value = self.redis.get(self.key(key))
+        return value.decode() if value is not None else None
+
+    def get(self, key):
+        value = self.lookup(key)
+        self.redis.hincrby(f"{self.name}:figures:counters", 'misses' if value is None else 'hits')
+        return value
+
+    def store(self, key, value):
+        user_id, name, data_version = key
+        prefix = f"{self.name}:figure:{user_id}:{name}:".encode()
+        old_keys = [k for k in self.redis.smembers(self.user_key(user_id)) if k.startswith(prefix)]
+
+        pipe = self.redis.pipeline()
+        if old_keys:
+            pipe.delete(*old_keys)
+            pipe.srem(self.user_key(user_id), *old_keys)
+        pipe.set(self.key(key), value, ex=self.ttl)
+        pipe.sadd(self.user_key(user_id), self.key(key))
+        pipe.execute()
+
+    def invalidate_user(self, user_id):
+        keys = list(self.redis.smembers(self.user_key(user_id)))
+        self.redis.delete(self.user_key(user_id), *keys)
+
+    def counters(self):
+        counters = self.redis.hgetall(f"{self.name}:figures:counters")
+        return int(counters.get(b'hits', 0)), int(counters.get(b'misses', 0)), 0
+
+    def size(self):
+        return sum(1 for _ in self.redis.scan_iter(f"{self.name}:figure:*"))
+
+
+def make_figure_cache(config):
+    """Builds the FIGURE_CACHE_BACKEND cache: 'memory', 'disk' or 'redis' (the default when REDIS_URL is configured)."""
+    backend = config.get('FIGURE_CACHE_BACKEND') or ('redis' if config.get('REDIS_URL') and not config.get('TESTING') else 'memory')
+    max_entries = config.get('FIGURE_CACHE_SIZE', 256)
+    ttl = config.get('FIGURE_CACHE_TTL') or None
+
+    if backend == 'redis':
+        return RedisFigureCache(config['REDIS_URL'], max_entries, ttl)
+    if backend == 'disk':
+        return DiskFigureCache(config['FIGURE_CACHE_DIR'], max_entries, ttl)
+    if backend != 'memory':
+        raise ValueError(f"Unknown FIGURE_CACHE_BACKEND: {backend}")
+
+    return InProcessFigureCache(max_entries, ttl)
+
+
+_figure_cache = None
+_figure_cache_lock = threading.Lock()
+
+
+def get_figure_cache(config):
+    """Returns the process-wide figure cache, building it from `config` on first use."""
+    global _figure_cache
+
+    with _figure_cache_lock:
+        if _figure_cache is None:
+            _figure_cache = make_figure_cache(config)
+
+        return _figure_cache
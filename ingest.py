@@ -0,0 +1,266 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.dialects import postgresql, sqlite
+
+from jobs import register_job
+from loader import link_tracks, load_tracks
+from models import db, User, Tracks, PlaylistSnapshots, Artists, Albums
+from queries import catalog_spotify_ids, user_spotify_ids
+from snapshots import invalidate_snapshot
+from stats import add_tracks
+from spotify import SpotifyFetcher, RateLimitedSpotify, SyncStats, chunked, get_spotify_client, get_token_bucket
+
+UPSERT_BATCH_SIZE = 200
+LOOKUP_BATCH_SIZE = 500
+
+
+def upsert(model, rows):
+    """Inserts `rows` (dicts of column values) into `model`'s table, overwriting rows whose primary key already exists."""
+    keys = [column.name for column in model.__table__.primary_key]
+    dialect = db.session.get_bind().dialect.name
+
+    for batch in chunked(rows, UPSERT_BATCH_SIZE):
+        if dialect not in ('postgresql', 'sqlite'):
+            for row in batch:
+                db.session.merge(model(**row))
+            continue
+
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert(model).values(batch)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=keys,
+            set_={column: stmt.excluded[column] for column in batch[0] if column not in keys}
+        )
+        db.session.execute(stmt)
+
+
+class MetadataStore:
+    """The shared artists/albums tables, consulted by SpotifyFetcher before it calls Spotify.
+
+    Rows fetched more than `ttl` ago count as missing, so they are refetched and overwritten.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    def fresh_rows(self, model, ids):
+        fresh_after = datetime.utcnow() - self.ttl
+        for batch in chunked(ids, LOOKUP_BATCH_SIZE):
+            yield from model.query.filter(model.spotify_id.in_(batch), model.fetched_at >= fresh_after)
+
+    def albums(self, album_ids):
+        return {
+            album.spotify_id: {'name': album.name, 'release_date': album.release_date}
+            for album in self.fresh_rows(Albums, album_ids)
+        }
+
+    def artists(self, artist_ids):
+        return {
+            artist.spotify_id: {'name': artist.name, 'popularity': artist.popularity, 'genres': artist.genres}
+            for artist in self.fresh_rows(Artists, artist_ids)
+        }
+
+    def save_albums(self, albums):
+        fetched_at = datetime.utcnow()
+        upsert(Albums, [{'spotify_id': album_id, **album, 'fetched_at': fetched_at} for album_id, album in albums.items()])
+
+    def save_artists(self, artists):
+        fetched_at = datetime.utcnow()
+        upsert(Artists, [{'spotify_id': artist_id, **artist, 'fetched_at': fetched_at} for artist_id, artist in artists.items()])
+
+
+def parse_release_date(release_date):
+    """Parses a Spotify release date ('2017', '2017-11' or '2017-11-12') into `(date, year, precision)`.
+
+    Year and month precision dates fall on the first day of their period.
+    Unparseable dates, like the '0000' Spotify uses for unknown ones, give Nones.
+    """
+    parts = (release_date or '').split("-")
+    precision = {1: 'year', 2: 'month', 3: 'day'}.get(len(parts))
+
+    try:
+        parsed = date(*(int(part) for part in parts + ['1'] * (3 - len(parts))))
+    except (TypeError, ValueError):
+        return None, None, None
+
+    return parsed, parsed.year, precision
+
+
+def release_date_columns(release_date):
+    parsed, year, precision = parse_release_date(release_date)
+    return {'release_date_parsed': parsed, 'release_year': year, 'release_date_precision': precision}
+
+
+def track_row(track):
+    """Maps an enriched track dict to the column values of a Tracks row."""
+    return dict(
+        acousticness=track['acousticness'],
+        album=track['album']['name'],
+        analysis_url=track['analysis_url'],
+        artist=track['artists'][0]['name'],
+        popularity=track['popularity'],
+        danceability=track['danceability'],
+        duration_ms=track['duration_ms'],
+        energy=track['energy'],
+        spotify_id=track['id'],
+        instrumentalness=track['instrumentalness'],
+        key=track['key'],
+        liveness=track['liveness'],
+        loudness=track['loudness'],
+        mode=track['mode'],
+        name=track['name'],
+        release_date=track['release_date'],
+        speechiness=track['speechiness'],
+        tempo=track['tempo'],
+        time_signature=track['time_signature'],
+        track_href=track['track_href'],
+        spotify_type=track['type'],
+        uri=track['uri'],
+        valence=track['valence'],
+        genres=track['genres'],
+        **release_date_columns(track['release_date'])
+    )
+
+
+def backfill_release_dates(batch_size=LOOKUP_BATCH_SIZE):
+    """Fills the parsed release date columns of tracks cataloged before they existed and returns how many were updated."""
+    updated = 0
+    last_id = 0
+
+    while True:
+        tracks = (
+            db.session.query(Tracks.id, Tracks.release_date)
+            .filter(Tracks.id > last_id, Tracks.release_year.is_(None), Tracks.release_date.isnot(None))
+            .order_by(Tracks.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not tracks:
+            return updated
+
+        db.session.bulk_update_mappings(Tracks, [
+            {'id': track_id, **release_date_columns(release_date)} for track_id, release_date in tracks
+        ])
+        db.session.commit()
+
+        updated += len(tracks)
+        last_id = tracks[-1].id
+
+
+def stream_tracks(fetcher, playlists, existing_spotify_ids, chunk_size, window_size):
+    """Yields `(rows, spotify_ids, playlists)` for chunks of at most `chunk_size` tracks new to the user.
+
+    `spotify_ids` are the chunk's tracks to link to the user and `rows` are
+    catalog rows for those of them not cataloged yet, the only ones whose
+    metadata is fetched. Playlists are read `window_size` at a time so only
+    one window of tracks is held in memory. `playlists` is empty except on
+    the last chunk of a window, where it lists the playlists whose new
+    tracks have all been yielded.
+    """
+    for window in chunked(playlists, window_size):
+        new_tracks = []
+        for tracks in fetcher.playlist_tracks([playlist['id'] for playlist in window]).values():
+            for track in tracks:
+                spotify_id = track['id']
+
+                if not spotify_id or spotify_id in existing_spotify_ids:  # checks if the song is already in the db or if the spotify id is not there (had an error with that)
+                    continue
+
+                existing_spotify_ids.add(spotify_id)  # the same track can show up in several playlists
+                new_tracks.append(track)
+
+        chunks = list(chunked(new_tracks, chunk_size)) or [[]]
+        for i, tracks in enumerate(chunks):
+            spotify_ids = [track['id'] for track in tracks]
+            cataloged = catalog_spotify_ids(spotify_ids) if spotify_ids else set()
+            rows = [track_row(track) for track in fetcher.enrich([track for track in tracks if track['id'] not in cataloged])]
+            yield rows, spotify_ids, window if i == len(chunks) - 1 else []
+
+
+def save_snapshots(user_id, playlists, snapshots):
+    """Records the current snapshot_id of playlists whose tracks are all stored."""
+    synced_at = datetime.utcnow()
+    for playlist in playlists:
+        snapshot = snapshots.get(playlist['id']) or PlaylistSnapshots(user_id=user_id, playlist_id=playlist['id'])
+        snapshot.snapshot_id = playlist['snapshot_id']
+        snapshot.synced_at = synced_at
+        db.session.add(snapshot)
+
+
+@register_job
+def sync_user_tracks(progress, user_id):
+    """Spotify API pull using the username to pull public playlist data. Runs as a background job.
+
+    New tracks are cataloged, linked to the user and committed a chunk at a
+    time as they are fetched, so memory stays flat and an error keeps
+    everything committed before it.
+    """
+    user = User.query.get(user_id)
+    client = get_spotify_client(os.getenv("CLIENT_ID"), os.getenv("CLIENT_SECRET"), current_app.config)
+    workers = current_app.config['SPOTIFY_CONCURRENCY']
+    stats = SyncStats(workers)
+    bucket = get_token_bucket(current_app.config['SPOTIFY_RATE_LIMIT'], current_app.config['SPOTIFY_BURST'])
+    sp = RateLimitedSpotify(client, bucket, stats)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        store = MetadataStore(timedelta(days=current_app.config['METADATA_TTL_DAYS']))
+        fetcher = SpotifyFetcher(sp, pool, store)
+        playlists = fetcher.user_playlists(user.username)
+
+        # Only playlists whose snapshot changed since the last sync need their tracks read
+        snapshots = {snapshot.playlist_id: snapshot for snapshot in PlaylistSnapshots.query.filter_by(user_id=user.user_id)}
+        changed = [
+            playlist for playlist in playlists
+            if playlist['id'] not in snapshots or snapshots[playlist['id']].snapshot_id != playlist['snapshot_id']
+        ]
+        progress(playlists_total=len(playlists), playlists_skipped=len(playlists) - len(changed), playlists_done=0, tracks_fetched=0, rows_inserted=0)
+
+        # Collect unique Spotify IDs of the user's existing tracks
+        existing_spotify_ids = user_spotify_ids(user.user_id)
+        existing_count = len(existing_spotify_ids)
+
+        playlists_done = 0
+        rows_inserted = 0
+        tracks_cataloged = 0
+        chunks = stream_tracks(
+            fetcher, changed, existing_spotify_ids,
+            current_app.config['INGEST_CHUNK_SIZE'], current_app.config['INGEST_PLAYLIST_WINDOW']
+        )
+
+        for rows, spotify_ids, finished_playlists in chunks:
+            tracks_cataloged += load_tracks(rows)
+            track_ids = link_tracks(user.user_id, spotify_ids)
+            add_tracks(user.user_id, track_ids)
+            inserted = len(track_ids)
+
+            # Snapshots are committed with the last chunk of their playlists so a failed sync re-reads them next time
+            save_snapshots(user.user_id, finished_playlists, snapshots)
+            db.session.commit()
+            if inserted:
+                invalidate_snapshot(user.user_id)
+
+            playlists_done += len(finished_playlists)
+            rows_inserted += inserted
+            progress(
+                playlists_done=playlists_done,
+                tracks_fetched=len(existing_spotify_ids) - existing_count,
+                rows_inserted=rows_inserted,
+                tracks_cataloged=tracks_cataloged,
+                spotify=stats.as_dict()
+            )
+
+    # Render the dashboard figures for the new data in the background so the next dashboard view is a cache read
+    precompute_job_id = None
+    if rows_inserted and current_app.config['PRECOMPUTE_FIGURES']:
+        precompute_job_id = current_app.extensions['job_queue'].enqueue('precompute_figures', user.user_id, owner=user.user_id)
+
+    return {
+        'message': 'Tracks added successfully',
+        'rows_inserted': rows_inserted,
+        'tracks_cataloged': tracks_cataloged,
+        'precompute_job_id': precompute_job_id,
+        'spotify': stats.as_dict()
+    }
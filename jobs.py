@@ -0,0 +1,155 @@
+import json
+import queue
+import threading
+import traceback
+import uuid
+from datetime import datetime
+
+import redis
+
+# Job functions that can be queued by name, see `register_job`
+JOB_FUNCTIONS = {}
+
+
+def register_job(func):
+    """Registers a function so it can be queued by name. Job functions are called as `func(progress, *args)`."""
+    JOB_FUNCTIONS[func.__name__] = func
+    return func
+
+
+def now():
+    return datetime.utcnow().isoformat()
+
+
+class BaseJobQueue:
+    """Shared bookkeeping for the job queues: job records, progress updates and running a job."""
+
+    def __init__(self, app):
+        self.app = app
+        # Lets jobs queue follow-up jobs through `current_app.extensions['job_queue']`
+        app.extensions['job_queue'] = self
+
+    def enqueue(self, func_name, *args, owner=None):
+        """Queues `func_name(*args)` and returns the new job id right away."""
+        if func_name not in JOB_FUNCTIONS:
+            raise ValueError(f"Unknown job function: {func_name}")
+
+        job_id = uuid.uuid4().hex
+        self.save(job_id, {
+            'id': job_id,
+            'func': func_name,
+            'args': list(args),
+            'owner': owner,
+            'status': 'queued',
+            'progress': {},
+            'result': None,
+            'error': None,
+            'enqueued_at': now(),
+            'started_at': None,
+            'finished_at': None
+        })
+        self.push(job_id)
+        return job_id
+
+    def update(self, job_id, **fields):
+        job = self.status(job_id)
+        job.update(fields)
+        self.save(job_id, job)
+
+    def run(self, job_id):
+        """Runs a queued job inside an app context, recording progress and the final result."""
+        job = self.status(job_id)
+        if job is None:
+            return
+
+        def progress(**counters):
+            self.update(job_id, progress={**self.status(job_id)['progress'], **counters})
+
+        self.update(job_id, status='running', started_at=now())
+
+        with self.app.app_context():
+            try:
+                result = JOB_FUNCTIONS[job['func']](progress, *job['args'])
+            except Exception as e:
+                self.app.logger.error(traceback.format_exc())
+                self.update(job_id, status='failed', error=str(e), finished_at=now())
+            else:
+                self.update(job_id, status='finished', result=result, finished_at=now())
+
+
+class InProcessJobQueue(BaseJobQueue):
+    """Runs jobs on a background thread in this process. Used for tests and local development."""
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.pending = queue.Queue()
+        self.worker = None
+
+    def save(self, job_id, job):
+        with self.lock:
+            self.jobs[job_id] = json.loads(json.dumps(job))
+
+    def status(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return json.loads(json.dumps(job)) if job else None
+
+    def push(self, job_id):
+        self.pending.put(job_id)
+
+        with self.lock:
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.work, daemon=True)
+                self.worker.start()
+
+    def work(self):
+        while True:
+            job_id = self.pending.get()
+            self.run(job_id)
+            self.pending.task_done()
+
+    def join(self):
+        """Blocks until every queued job has run."""
+        self.pending.join()
+
+
+class RedisJobQueue(BaseJobQueue):
+    """Keeps job records and the pending list in redis. Jobs are run by `python worker.py`."""
+
+    def __init__(self, app, url, name='datalens'):
+        super().__init__(app)
+        self.redis = redis.Redis.from_url(url)
+        self.name = name
+        self.result_ttl = app.config.get('JOB_RESULT_TTL', 60 * 60 * 24)
+
+    def key(self, job_id):
+        return f"{self.name}:job:{job_id}"
+
+    def save(self, job_id, job):
+        self.redis.set(self.key(job_id), json.dumps(job), ex=self.result_ttl)
+
+    def status(self, job_id):
+        job = self.redis.get(self.key(job_id))
+        return json.loads(job) if job else None
+
+    def push(self, job_id):
+        self.redis.lpush(f"{self.name}:pending", job_id)
+
+    def work(self):
+        """Worker loop, pops job ids off the pending list forever."""
+        while True:
+            _, job_id = self.redis.brpop(f"{self.name}:pending")
+            self.run(job_id.decode())
+
+
+def make_job_queue(app):
+    """Uses redis when REDIS_URL is configured, otherwise runs jobs in-process."""
+    if app.config.get('REDIS_URL') and not app.config.get('TESTING'):
+        return RedisJobQueue(app, app.config['REDIS_URL'])
+
+    if not (app.debug or app.testing):
+        # Jobs and their status live in this process, so other worker processes can't report on them
+        app.logger.warning("REDIS_URL is not set, running jobs in-process. Run a single worker process or configure redis.")
+    return InProcessJobQueue(app)
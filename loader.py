@@ -0,0 +1,109 @@
+import csv
+import io
+from datetime import datetime
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, Tracks, TrackGenres, UserTracks
+
+# Every Tracks column except the serial id, in the order rows are written to the staging table
+TRACK_COLUMNS = [column.name for column in Tracks.__table__.columns if column.name != 'id']
+
+COPY_NULL = r'\N'
+
+
+def copy_tracks_postgres(rows):
+    """COPYs rows into a temporary staging table, then moves them into tracks skipping spotify ids already cataloged."""
+    columns = ", ".join(TRACK_COLUMNS)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([COPY_NULL if row.get(column) is None else row[column] for column in TRACK_COLUMNS])
+    buffer.seek(0)
+
+    connection = db.session.connection()
+    connection.execute(text(f"CREATE TEMP TABLE IF NOT EXISTS tracks_staging AS SELECT {columns} FROM tracks WITH NO DATA"))
+
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY tracks_staging ({columns}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')", buffer)
+    finally:
+        cursor.close()
+
+    result = connection.execute(text(
+        f"INSERT INTO tracks ({columns}) SELECT {columns} FROM tracks_staging "
+        "ON CONFLICT (spotify_id) DO NOTHING"
+    ))
+    connection.execute(text("TRUNCATE tracks_staging"))
+    return result.rowcount
+
+
+def insert_tracks_sqlite(rows):
+    """Batched executemany insert that skips spotify ids already cataloged."""
+    stmt = sqlite.insert(Tracks.__table__).on_conflict_do_nothing(index_elements=['spotify_id'])
+    result = db.session.connection().execute(stmt, [{column: row.get(column) for column in TRACK_COLUMNS} for row in rows])
+    return result.rowcount
+
+
+def load_tracks(rows):
+    """Bulk inserts track rows (dicts keyed by Tracks column) and their genres into the catalog in the current transaction.
+
+    Loading is idempotent: a track already in the catalog is skipped by the
+    unique spotify_id, so overlapping syncs can't duplicate it. Returns how
+    many tracks were new to the catalog.
+    """
+    if not rows:
+        return 0
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        inserted = copy_tracks_postgres(rows)
+    elif dialect == 'sqlite':
+        inserted = insert_tracks_sqlite(rows)
+    else:
+        db.session.bulk_insert_mappings(Tracks, rows)
+        inserted = len(rows)
+
+    load_genres(rows)
+    return inserted
+
+
+def split_genres(genres):
+    """The genres of a comma-joined genres string, without blanks or repeats."""
+    return list(dict.fromkeys(genre for genre in (genres or '').split(",") if genre))
+
+
+def load_genres(rows):
+    """Writes a track_genres row for each genre of the cataloged tracks among `rows`."""
+    genres = {row['spotify_id']: split_genres(row.get('genres')) for row in rows}
+    track_ids = db.session.query(Tracks.spotify_id, Tracks.id).filter(Tracks.spotify_id.in_(list(genres)))
+    genre_rows = [
+        {'track_id': track_id, 'genre': genre}
+        for spotify_id, track_id in track_ids
+        for genre in genres[spotify_id]
+    ]
+    if not genre_rows:
+        return
+
+    dialect = db.session.get_bind().dialect.name
+    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    db.session.connection().execute(insert(TrackGenres.__table__).on_conflict_do_nothing(), genre_rows)
+
+
+def link_tracks(user_id, spotify_ids):
+    """Adds the cataloged tracks among `spotify_ids` to the user's library and returns the ids of the newly linked tracks."""
+    if not spotify_ids:
+        return []
+
+    dialect = db.session.get_bind().dialect.name
+    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    tracks = select(db.literal(user_id), Tracks.id, db.literal(datetime.utcnow())).where(Tracks.spotify_id.in_(spotify_ids))
+    stmt = (
+        insert(UserTracks.__table__)
+        .from_select(['user_id', 'track_id', 'added_at'], tracks)
+        .on_conflict_do_nothing()
+        .returning(UserTracks.track_id)
+    )
+
+    return [track_id for track_id, in db.session.connection().execute(stmt)]
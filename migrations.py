@@ -0,0 +1,111 @@
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from loader import split_genres
+from models import db
+
+# `db.create_all()` only creates missing tables, changes to tables that already exist are applied here in order
+MIGRATIONS = []
+
+# Catalog columns the legacy songs table had, later columns are filled in by their own migrations
+LEGACY_TRACK_COLUMNS = [
+    'acousticness', 'album', 'analysis_url', 'artist', 'popularity', 'danceability', 'duration_ms', 'energy',
+    'spotify_id', 'instrumentalness', 'key', 'liveness', 'loudness', 'mode', 'name', 'release_date',
+    'speechiness', 'tempo', 'time_signature', 'track_href', 'spotify_type', 'uri', 'valence', 'genres'
+]
+
+
+def migration(func):
+    """Registers a schema change. Migrations must be safe to run against a database created by the current models."""
+    MIGRATIONS.append(func)
+    return func
+
+
+@migration
+def songs_unique_user_spotify_id(connection):
+    """Drops duplicate songs per user and adds a unique (user_id, spotify_id) index to the legacy songs table."""
+    if not inspect(connection).has_table('songs'):
+        return
+
+    connection.execute(text(
+        "DELETE FROM songs WHERE id NOT IN (SELECT MIN(id) FROM songs GROUP BY user_id, spotify_id)"
+    ))
+    connection.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS songs_user_id_spotify_id_key ON songs (user_id, spotify_id)"
+    ))
+
+
+@migration
+def songs_to_tracks(connection):
+    """Moves the per-user songs table into the tracks catalog and user_tracks links.
+
+    Each Spotify track is cataloged once, from its most recent songs row. The
+    legacy songs table is left in place and can be dropped once the move is checked.
+    """
+    if not inspect(connection).has_table('songs'):
+        return
+
+    columns = ", ".join(LEGACY_TRACK_COLUMNS)
+    connection.execute(text(
+        f"INSERT INTO tracks ({columns}) SELECT {columns} FROM songs "
+        "WHERE id IN (SELECT MAX(id) FROM songs WHERE spotify_id IS NOT NULL GROUP BY spotify_id) "
+        "AND spotify_id NOT IN (SELECT spotify_id FROM tracks)"
+    ))
+    connection.execute(text(
+        "INSERT INTO user_tracks (user_id, track_id, played_at, added_at) "
+        "SELECT songs.user_id, tracks.id, songs.played_at, :added_at FROM songs "
+        "JOIN tracks ON tracks.spotify_id = songs.spotify_id "
+        "WHERE songs.id IN (SELECT MIN(id) FROM songs GROUP BY user_id, spotify_id) "
+        "AND NOT EXISTS (SELECT 1 FROM user_tracks WHERE user_tracks.user_id = songs.user_id AND user_tracks.track_id = tracks.id)"
+    ), {'added_at': datetime.utcnow()})
+
+
+@migration
+def track_genres_from_strings(connection):
+    """Fills track_genres from the comma-joined genres of tracks cataloged before the relation existed."""
+    tracks = connection.execute(text(
+        "SELECT id, genres FROM tracks WHERE id NOT IN (SELECT track_id FROM track_genres)"
+    ))
+    genre_rows = [
+        {'track_id': track_id, 'genre': genre}
+        for track_id, genres in tracks
+        for genre in split_genres(genres)
+    ]
+    if genre_rows:
+        connection.execute(text("INSERT INTO track_genres (track_id, genre) VALUES (:track_id, :genre)"), genre_rows)
+
+
+@migration
+def tracks_release_date_columns(connection):
+    """Adds the parsed release date columns to a tracks table created before them, `flask backfill-release-dates` fills them."""
+    columns = {column['name'] for column in inspect(connection).get_columns('tracks')}
+
+    for name, type_ in (('release_date_parsed', 'DATE'), ('release_year', 'INTEGER'), ('release_date_precision', 'VARCHAR')):
+        if name not in columns:
+            connection.execute(text(f"ALTER TABLE tracks ADD COLUMN {name} {type_}"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_tracks_release_year ON tracks (release_year)"))
+
+
+def upgrade():
+    """Applies every migration not yet recorded in schema_migrations and returns their names."""
+    applied = []
+
+    with db.engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations (name VARCHAR PRIMARY KEY, applied_at TIMESTAMP NOT NULL)"
+        ))
+        done = {row[0] for row in connection.execute(text("SELECT name FROM schema_migrations"))}
+
+        for func in MIGRATIONS:
+            if func.__name__ in done:
+                continue
+
+            func(connection)
+            connection.execute(
+                text("INSERT INTO schema_migrations (name, applied_at) VALUES (:name, :applied_at)"),
+                {'name': func.__name__, 'applied_at': datetime.utcnow()}
+            )
+            applied.append(func.__name__)
+
+    return applied
@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from flask_bcrypt import Bcrypt
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
@@ -43,8 +45,10 @@ class User(db.Model, UserMixin):
         nullable=False,
     )
     
-    songs = db.relationship('Songs', backref='user', cascade='all, delete-orphan')
+    user_tracks = db.relationship('UserTracks', backref='user', cascade='all, delete-orphan')
     dashboards = db.relationship('UserFavoriteDashboards', backref='user', cascade='all, delete-orphan')
+    playlist_snapshots = db.relationship('PlaylistSnapshots', backref='user', cascade='all, delete-orphan')
+    stats = db.relationship('UserStats', backref='user', uselist=False, cascade='all, delete-orphan')
 
     def __repr__(self):
         return f"<User #{self.user_id}: {self.username}, {self.email}>"
@@ -148,10 +152,10 @@ class UserFavoriteDashboards(db.Model):
     )
     
 
-class Songs(db.Model):
-    """Songs table, saves all of a users favorite songs for later access"""
+class Tracks(db.Model):
+    """Global track catalog, audio features and metadata are stored once per Spotify track however many users have it"""
     
-    __tablename__ = 'songs'
+    __tablename__ = 'tracks'
     
     id = db.Column(
         db.Integer, 
@@ -183,7 +187,9 @@ class Songs(db.Model):
         db.Float
     )
     spotify_id = db.Column(
-        db.String
+        db.String,
+        nullable=False,
+        unique=True
     )
     instrumentalness = db.Column(
         db.Float
@@ -207,6 +213,16 @@ class Songs(db.Model):
     release_date = db.Column(
         db.String
     )
+    release_date_parsed = db.Column(
+        db.Date
+    )
+    release_year = db.Column(
+        db.Integer,
+        index=True
+    )
+    release_date_precision = db.Column(
+        db.String
+    )
     speechiness = db.Column(
         db.Float
     )
@@ -231,14 +247,186 @@ class Songs(db.Model):
     genres = db.Column(
         db.String
     )
+
+
+class UserTracks(db.Model):
+    """Links a user to the catalog tracks found in their playlists"""
+
+    __tablename__ = 'user_tracks'
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.user_id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    track_id = db.Column(
+        db.Integer,
+        db.ForeignKey('tracks.id', ondelete='CASCADE'),
+        primary_key=True,
+        index=True
+    )
     played_at = db.Column(
         db.String,
     )
+    added_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow
+    )
+
+
+class TrackGenres(db.Model):
+    """One row per genre of a catalog track, so genre counts and filters run as indexed SQL"""
+
+    __tablename__ = 'track_genres'
+
+    track_id = db.Column(
+        db.Integer,
+        db.ForeignKey('tracks.id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    genre = db.Column(
+        db.String,
+        primary_key=True,
+        index=True
+    )
+
+
+class UserStats(db.Model):
+    """Per-user rollup of the library, updated in the same transaction as each ingestion batch.
+
+    Counts are kept per value (artist, album, genre, release year) so distinct
+    counts and top-N charts are read straight off the row. The feature_* columns
+    are running sufficient statistics over songs with every heatmap feature set:
+    how many, the per-feature sums and the matrix of summed cross products.
+    """
+
+    __tablename__ = 'user_stats'
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.user_id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    song_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0
+    )
+    artist_counts = db.Column(
+        db.JSON,
+        nullable=False,
+        default=dict
+    )
+    album_counts = db.Column(
+        db.JSON,
+        nullable=False,
+        default=dict
+    )
+    genre_counts = db.Column(
+        db.JSON,
+        nullable=False,
+        default=dict
+    )
+    year_counts = db.Column(
+        db.JSON,
+        nullable=False,
+        default=dict
+    )
+    feature_n = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0
+    )
+    feature_sums = db.Column(
+        db.JSON
+    )
+    feature_products = db.Column(
+        db.JSON
+    )
+    data_version = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0
+    )
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow
+    )
+
+
+class PlaylistSnapshots(db.Model):
+    """Spotify snapshot_id of each playlist as of its last sync, playlists with an unchanged snapshot are skipped"""
+
+    __tablename__ = 'playlistsnapshots'
+
     user_id = db.Column(
         db.Integer,
         db.ForeignKey('users.user_id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    playlist_id = db.Column(
+        db.String,
+        primary_key=True
+    )
+    snapshot_id = db.Column(
+        db.String,
         nullable=False
     )
+    synced_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow
+    )
+
+
+
+class Artists(db.Model):
+    """Spotify artist metadata shared by every user, refetched once `fetched_at` is older than the metadata TTL"""
+
+    __tablename__ = 'artists'
+
+    spotify_id = db.Column(
+        db.String,
+        primary_key=True
+    )
+    name = db.Column(
+        db.String
+    )
+    popularity = db.Column(
+        db.Integer
+    )
+    genres = db.Column(
+        db.String
+    )
+    fetched_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow
+    )
+
+
+class Albums(db.Model):
+    """Spotify album metadata shared by every user, refetched once `fetched_at` is older than the metadata TTL"""
+
+    __tablename__ = 'albums'
+
+    spotify_id = db.Column(
+        db.String,
+        primary_key=True
+    )
+    name = db.Column(
+        db.String
+    )
+    release_date = db.Column(
+        db.String
+    )
+    fetched_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow
+    )
    
     
 def connect_db(app):
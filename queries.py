@@ -0,0 +1,118 @@
+from datetime import date
+
+import numpy as np
+from sqlalchemy import func
+
+from models import db, Tracks, TrackGenres, UserTracks
+
+# Rows fetched per round trip when streaming a user's songs
+YIELD_PER = 1000
+
+# Columns of a user's song rows: the catalog columns plus the per-user link columns
+SONG_COLUMNS = [column for column in Tracks.__table__.columns if column.name != 'id'] + [UserTracks.user_id, UserTracks.played_at]
+
+
+def user_songs(user_id, *columns):
+    """Query for the songs in a user's library, joining their links to the track catalog.
+
+    With no `columns` every catalog column is selected, so each row has the
+    same attributes (name, artist, energy, genres...) the old per-user songs
+    rows had. Pass columns, e.g. `user_songs(user_id, Tracks.name, Tracks.energy)`,
+    to load only what a caller needs.
+    """
+    return (
+        db.session.query(*(columns or SONG_COLUMNS))
+        .select_from(UserTracks)
+        .join(Tracks, Tracks.id == UserTracks.track_id)
+        .filter(UserTracks.user_id == user_id)
+    )
+
+
+def song_rows(user_id, *names):
+    """Streams tuples of only the named Tracks columns of a user's songs, `YIELD_PER` rows per fetch."""
+    return user_songs(user_id, *(getattr(Tracks, name) for name in names)).yield_per(YIELD_PER)
+
+
+def column_dtype(column):
+    """NumPy dtype a Tracks column is loaded as: floats (NULL as nan) for numbers, days for dates, objects otherwise."""
+    python_type = column.type.python_type
+    if python_type in (int, float):
+        return float
+    if python_type is date:
+        return 'datetime64[D]'
+    return object
+
+
+def song_arrays(user_id, *names):
+    """The named Tracks columns of a user's songs as a dict of equal-length NumPy arrays keyed by column name.
+
+    Only the requested columns are selected and rows are streamed as plain
+    tuples, so no ORM objects are built for the user's library.
+    """
+    values = list(zip(*song_rows(user_id, *names))) or [()] * len(names)
+    return {
+        name: np.array(column_values, dtype=column_dtype(getattr(Tracks, name)))
+        for name, column_values in zip(names, values)
+    }
+
+
+def user_spotify_ids(user_id):
+    """Spotify ids of every track in a user's library."""
+    return {spotify_id for spotify_id, in user_songs(user_id, Tracks.spotify_id)}
+
+
+def catalog_spotify_ids(spotify_ids):
+    """The subset of `spotify_ids` already in the track catalog."""
+    return {spotify_id for spotify_id, in db.session.query(Tracks.spotify_id).filter(Tracks.spotify_id.in_(spotify_ids))}
+
+
+def user_genres(user_id, *columns):
+    """Query for (genre, *columns) of every genre of every song in a user's library."""
+    return (
+        user_songs(user_id, TrackGenres.genre, *columns)
+        .join(TrackGenres, TrackGenres.track_id == UserTracks.track_id)
+    )
+
+
+def top_genres(user_id, limit=10):
+    """The user's `limit` most common genres (all of them for None) as (genre, song count), most common first."""
+    count = func.count(UserTracks.track_id)
+    return user_genres(user_id, count).group_by(TrackGenres.genre).order_by(count.desc(), TrackGenres.genre).limit(limit).all()
+
+
+def top_values(user_id, column, limit=10):
+    """The `limit` most common values (all of them for None) of a Tracks column in a user's library as (value, song count), most common first."""
+    count = func.count(UserTracks.track_id)
+    return user_songs(user_id, column, count).group_by(column).order_by(count.desc(), column).limit(limit).all()
+
+
+def year_counts(user_id):
+    """(release year, song count) for every year in a user's library, oldest first."""
+    return (
+        user_songs(user_id, Tracks.release_year, func.count(UserTracks.track_id))
+        .filter(Tracks.release_year.isnot(None))
+        .group_by(Tracks.release_year)
+        .order_by(Tracks.release_year)
+        .all()
+    )
+
+
+def feature_moments(user_id, names):
+    """(count, sums, summed cross products) of the named Tracks columns over a user's songs with all of them set, in one query.
+
+    Sums are a list per column and cross products a matrix, like the feature_* columns of UserStats.
+    """
+    columns = [getattr(Tracks, name) for name in names]
+    pairs = [(i, j) for i in range(len(columns)) for j in range(i, len(columns))]
+    row = (
+        user_songs(user_id, func.count(UserTracks.track_id), *(func.sum(column) for column in columns),
+                   *(func.sum(columns[i] * columns[j]) for i, j in pairs))
+        .filter(*(column.isnot(None) for column in columns))
+        .one()
+    )
+
+    sums = [float(value or 0) for value in row[1:len(columns) + 1]]
+    products = [[0.0] * len(columns) for _ in columns]
+    for (i, j), value in zip(pairs, row[len(columns) + 1:]):
+        products[i][j] = products[j][i] = float(value or 0)
+    return row[0], sums, products
@@ -0,0 +1,60 @@
+import numpy as np
+import plotly.graph_objects as go
+
+from stats import HEATMAP_FEATURES
+
+
+def fit_sums(n, sum_x, sum_y, sum_xx, sum_xy, sum_yy):
+    """Closed-form least-squares fit of y = slope * x + intercept from sufficient statistics.
+
+    Returns (slope, intercept, r_squared), or None when there are fewer than
+    two points or x never varies.
+    """
+    if n < 2:
+        return None
+
+    sxx = sum_xx - sum_x * sum_x / n
+    sxy = sum_xy - sum_x * sum_y / n
+    syy = sum_yy - sum_y * sum_y / n
+    if sxx <= 0:
+        return None
+
+    slope = sxy / sxx
+    intercept = (sum_y - slope * sum_x) / n
+    r_squared = sxy * sxy / (sxx * syy) if syy > 0 else 1.0
+    return slope, intercept, r_squared
+
+
+def fit_features(stats, x_feature, y_feature):
+    """Fits one heatmap feature on another straight from the running sums in a user's UserStats row, in O(1)."""
+    i = HEATMAP_FEATURES.index(x_feature)
+    j = HEATMAP_FEATURES.index(y_feature)
+    sums = stats.feature_sums
+    products = stats.feature_products
+    return fit_sums(stats.feature_n, sums[i], sums[j], products[i][i], products[i][j], products[j][j])
+
+
+def trendline_trace(fit, x_min, x_max, x_label, y_label):
+    """The fitted line across [x_min, x_max] as its own scatter trace, hovering the equation like plotly express does."""
+    slope, intercept, r_squared = fit
+    return go.Scatter(
+        x=[x_min, x_max],
+        y=[slope * x_min + intercept, slope * x_max + intercept],
+        mode='lines',
+        name='OLS trendline',
+        showlegend=False,
+        hovertemplate=(
+            "<b>OLS trendline</b><br>"
+            f"{y_label} = {slope:.6g} * {x_label} + {intercept:.6g}<br>"
+            f"R<sup>2</sup>={r_squared:.6f}<extra></extra>"
+        )
+    )
+
+
+def add_trendline(fig, fit, x, x_label, y_label):
+    """Adds the fitted line over the range of `x` to a scatter figure, unless there's nothing to fit."""
+    x = np.asarray(x, dtype=float)
+    if fit is None or not np.isfinite(x).any():
+        return fig
+
+    return fig.add_trace(trendline_trace(fit, np.nanmin(x), np.nanmax(x), x_label, y_label))
@@ -0,0 +1,81 @@
+import numpy as np
+
+# Cells per axis of the grid stratified_sample spreads its sample over
+SAMPLE_BINS = 50
+
+
+def grid_cells(x, y, bins):
+    """The cell of a bins x bins grid over the range of x and y that each point falls in."""
+    def axis_cells(values):
+        low, high = values.min(), values.max()
+        if high == low:
+            return np.zeros(len(values), dtype=int)
+        return np.minimum(((values - low) / (high - low) * bins).astype(int), bins - 1)
+
+    return axis_cells(x) * bins + axis_cells(y)
+
+
+def stratified_sample(x, y, max_points, bins=SAMPLE_BINS, seed=0):
+    """Sorted indices of at most `max_points` points of a scatter, sampled so the plot keeps its shape.
+
+    Every occupied cell of a bins x bins grid keeps at least one point, so
+    sparse regions and outliers survive, and dense cells share the rest of the
+    budget in proportion to their size. Points missing x or y are dropped.
+    The sample is seeded, so the same data always gives the same figure.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    points = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    if len(points) <= max_points:
+        return points
+
+    rng = np.random.default_rng(seed)
+    cells = grid_cells(x[points], y[points], bins)
+    counts = np.bincount(cells, minlength=bins * bins)
+    occupied = np.count_nonzero(counts)
+    if occupied >= max_points:
+        return np.sort(rng.choice(points, max_points, replace=False))
+
+    # One point per occupied cell, then the remaining budget split in proportion to what's left of each cell
+    rate = (max_points - occupied) / (len(points) - occupied)
+    quota = np.where(counts > 0, 1 + np.floor((counts - 1) * rate), 0)
+
+    # Shuffle within cells and keep each cell's first `quota` points
+    order = np.lexsort((rng.random(len(points)), cells))
+    sorted_cells = cells[order]
+    rank = np.arange(len(order)) - np.searchsorted(sorted_cells, sorted_cells)
+    return np.sort(points[order[rank < quota[sorted_cells]]])
+
+
+def quantiles(values, qs):
+    """Linearly interpolated quantiles of `values`, like np.quantile's default, from one partial sort in O(n)."""
+    positions = np.asarray(qs, dtype=float) * (len(values) - 1)
+    below = np.floor(positions).astype(int)
+    above = np.minimum(below + 1, len(values) - 1)
+    parted = np.partition(values, np.union1d(below, above))
+    return parted[below] + (parted[above] - parted[below]) * (positions - below)
+
+
+def box_stats(values):
+    """Box plot statistics of `values` as plotly draws them: quartiles, whiskers at 1.5 IQR, and the points beyond.
+
+    Everything is found with partitioning and masks, in O(n). Returns None
+    when no value is set.
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return None
+
+    q1, median, q3 = quantiles(values, [0.25, 0.5, 0.75])
+    iqr = q3 - q1
+    lower_fence = values[values >= q1 - 1.5 * iqr].min()
+    upper_fence = values[values <= q3 + 1.5 * iqr].max()
+    return {
+        'q1': q1,
+        'median': median,
+        'q3': q3,
+        'lowerfence': lower_fence,
+        'upperfence': upper_fence,
+        'outliers': values[(values < lower_fence) | (values > upper_fence)]
+    }
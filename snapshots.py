@@ -0,0 +1,127 @@
+import os
+import shutil
+import uuid
+
+import numpy as np
+from flask import current_app
+
+from models import db, Tracks, UserTracks
+from queries import song_arrays, user_genres
+
+# Columns kept in each user's snapshot: everything the charts read from the catalog
+SNAPSHOT_COLUMNS = [
+    'name', 'artist', 'album', 'release_year', 'release_date_parsed', 'popularity', 'danceability', 'energy',
+    'loudness', 'speechiness', 'acousticness', 'instrumentalness', 'liveness', 'valence'
+]
+
+# The genre inverted index kept next to them, see genre_index
+GENRE_INDEX_ARRAYS = ['genres', 'genre_offsets', 'genre_rows']
+
+
+def snapshot_dir(user_id):
+    return os.path.join(current_app.config['SNAPSHOT_DIR'], str(user_id))
+
+
+def library_size(user_id):
+    return db.session.query(UserTracks).filter(UserTracks.user_id == user_id).count()
+
+
+def to_storable(array):
+    """Strings are stored as fixed-width unicode (NULL as '') so every column can be memory-mapped."""
+    if array.dtype == object:
+        return np.array(['' if value is None else value for value in array], dtype=str)
+    return array
+
+
+def genre_index(user_id, track_ids):
+    """Inverted index from each genre in the user's library to the snapshot rows of its songs.
+
+    `track_ids` are the track ids of the snapshot rows. The index is in CSR
+    form: genre i's rows are genre_rows[genre_offsets[i]:genre_offsets[i + 1]],
+    and genres come most common first, so the first n are the top n genres.
+    """
+    pairs = user_genres(user_id, Tracks.id).all()
+    pair_genres = np.array([genre for genre, track_id in pairs], dtype=object)
+    pair_tracks = np.array([track_id for genre, track_id in pairs], dtype=np.int64)
+
+    # Rows of the tracks, skipping any linked after the snapshot columns were read
+    known = np.isin(pair_tracks, track_ids)
+    order = np.argsort(track_ids)
+    rows = order[np.searchsorted(track_ids, pair_tracks[known], sorter=order)]
+
+    genres, codes, counts = np.unique(pair_genres[known], return_inverse=True, return_counts=True)
+    ranking = np.lexsort((genres, -counts))
+    rank = np.empty(len(ranking), dtype=np.int64)
+    rank[ranking] = np.arange(len(ranking))
+
+    return {
+        'genres': genres[ranking],
+        'genre_offsets': np.concatenate([[0], np.cumsum(counts[ranking])]).astype(np.int64),
+        'genre_rows': rows[np.argsort(rank[codes], kind='stable')]
+    }
+
+
+def snapshot_data(user_id):
+    """The snapshot columns and genre index of the user's library, read from the database."""
+    arrays = song_arrays(user_id, 'id', *SNAPSHOT_COLUMNS)
+    arrays.update(genre_index(user_id, arrays.pop('id').astype(np.int64)))
+    return arrays
+
+
+def build_snapshot(user_id):
+    """Writes the user's snapshot columns and genre index as .npy files, moving the finished directory into place in one rename."""
+    arrays = snapshot_data(user_id)
+    path = snapshot_dir(user_id)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(tmp_path)
+
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), to_storable(array))
+
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # Another request built the snapshot first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def load_snapshot(user_id):
+    """Memory-maps the user's snapshot columns and genre index, or returns None if there is no complete snapshot."""
+    path = snapshot_dir(user_id)
+    try:
+        return {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name in SNAPSHOT_COLUMNS + GENRE_INDEX_ARRAYS}
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def user_snapshot(user_id):
+    """The user's audio features and metadata as contiguous, memory-mapped NumPy arrays keyed by column name.
+
+    The snapshot is built from the database the first time it's needed and
+    rebuilt when it doesn't cover every song in the library, e.g. if a sync
+    committed between invalidation and a rebuild.
+    """
+    snapshot = load_snapshot(user_id)
+    if snapshot is not None and len(snapshot['name']) == library_size(user_id):
+        return snapshot
+
+    invalidate_snapshot(user_id)
+    build_snapshot(user_id)
+    return load_snapshot(user_id) or snapshot_data(user_id)
+
+
+def snapshot_arrays(user_id, *names):
+    """Like queries.song_arrays, but served from the user's snapshot. The genre index arrays can be named too."""
+    snapshot = user_snapshot(user_id)
+    return {name: snapshot[name] for name in names}
+
+
+def invalidate_snapshot(user_id):
+    """Drops the user's snapshot, called whenever their library changes."""
+    path = snapshot_dir(user_id)
+    doomed = f"{path}.{uuid.uuid4().hex}.old"
+    try:
+        os.rename(path, doomed)
+    except FileNotFoundError:
+        return
+    shutil.rmtree(doomed, ignore_errors=True)
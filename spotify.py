@@ -0,0 +1,370 @@
+import re
+import threading
+import time
+
+import requests
+import spotipy
+from requests.adapters import HTTPAdapter
+from spotipy import SpotifyException
+from spotipy.cache_handler import MemoryCacheHandler
+from spotipy.oauth2 import SpotifyClientCredentials
+from urllib3.util.retry import Retry
+
+from transport import make_transport_session
+
+# Maximum number of IDs accepted by each of Spotify's bulk endpoints
+AUDIO_FEATURES_BATCH_SIZE = 100
+ALBUMS_BATCH_SIZE = 20
+ARTISTS_BATCH_SIZE = 50
+PLAYLIST_PAGE_SIZE = 100
+PLAYLISTS_PAGE_SIZE = 50
+
+# Only the parts of a playlist item that ingestion reads, the rest comes from the audio features
+PLAYLIST_ITEM_FIELDS = "items(track(id,name,type,album(id,name),artists(id,name))),total"
+
+# Status codes retried by the HTTP session. 429s aren't retried there at all, not even for their Retry-After header,
+# so RateLimitedSpotify can pause every thread on the shared bucket and count the backoff
+SPOTIPY_STATUS_FORCELIST = (500, 502, 503, 504)
+
+
+def chunked(items, size):
+    """Yields successive lists of at most `size` items."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def clean_genres(genres):
+    """Strips stray braces/quotes from Spotify genres and joins them into the comma string we store."""
+    cleaned = [re.sub(r'[{}"]', '', genre).strip() for genre in genres if genre.strip()]
+    return ",".join(cleaned)
+
+
+class SharedClientCredentials(SpotifyClientCredentials):
+    """Client-credentials auth whose token is kept in memory, shared by every thread
+    and refreshed `refresh_margin` seconds before it expires."""
+
+    def __init__(self, client_id, client_secret, requests_session, refresh_margin=300):
+        super().__init__(client_id, client_secret, requests_session=requests_session, cache_handler=MemoryCacheHandler())
+        self.refresh_margin = refresh_margin
+        self.lock = threading.Lock()
+
+    def get_access_token(self, as_dict=False, check_cache=True):
+        with self.lock:
+            token_info = self.cache_handler.get_cached_token()
+            if not check_cache or not token_info or token_info['expires_at'] - time.time() < self.refresh_margin:
+                token_info = self._add_custom_values_to_token_info(self._request_access_token())
+                self.cache_handler.save_token_to_cache(token_info)
+
+        return token_info if as_dict else token_info['access_token']
+
+
+def make_session(pool_size, session=None):
+    """A keep-alive session whose connection pool is sized for `pool_size` concurrent requests.
+
+    Pass `session` to set up a custom transport (see transport.py) instead of a plain requests.Session.
+    """
+    retry = Retry(
+        total=3,
+        connect=None,
+        read=False,
+        allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+        status=3,
+        backoff_factor=0.3,
+        status_forcelist=SPOTIPY_STATUS_FORCELIST,
+        respect_retry_after_header=False
+    )
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=retry)
+
+    session = session if session is not None else requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_spotify_client(client_id, client_secret, config):
+    """Returns the process-wide spotipy client, building it on first use.
+
+    The client and its auth manager share one pooled session, so connections
+    and the access token are reused across syncs instead of being set up per
+    sync. The session, and its SPOTIFY_TRANSPORT, are only made when the
+    client is built.
+    """
+    global _client
+
+    with _client_lock:
+        if _client is None:
+            session = make_session(config['SPOTIFY_POOL_SIZE'], make_transport_session(config))
+            auth_manager = SharedClientCredentials(client_id, client_secret, session, config['SPOTIFY_TOKEN_REFRESH_MARGIN'])
+            _client = spotipy.Spotify(auth_manager=auth_manager, requests_session=session)
+
+        return _client
+
+
+class SyncStats:
+    """Thread-safe counters describing the Spotify traffic of one sync."""
+
+    def __init__(self, workers=1):
+        self.lock = threading.Lock()
+        self.workers = workers
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.throttled = 0
+        self.backoff_seconds = 0.0
+        self.started = time.monotonic()
+
+    def request_started(self):
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def request_finished(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def backed_off(self, seconds):
+        with self.lock:
+            self.throttled += 1
+            self.backoff_seconds += seconds
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                'workers': self.workers,
+                'requests': self.requests,
+                'max_concurrency': self.max_in_flight,
+                'throttled': self.throttled,
+                'backoff_seconds': round(self.backoff_seconds, 3),
+                'elapsed_seconds': round(time.monotonic() - self.started, 3)
+            }
+
+
+class TokenBucket:
+    """Allows `rate` requests per second with bursts of up to `capacity`, shared by every thread that calls `acquire`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a request may be sent."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Holds back every caller for `seconds`, used when Spotify answers 429 with a Retry-After."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+_shared_buckets = {}
+_shared_buckets_lock = threading.Lock()
+
+
+def get_token_bucket(rate, capacity=None):
+    """Returns the process-wide bucket for this rate so concurrent syncs share one request budget."""
+    with _shared_buckets_lock:
+        key = (rate, capacity)
+        if key not in _shared_buckets:
+            _shared_buckets[key] = TokenBucket(rate, capacity)
+        return _shared_buckets[key]
+
+
+class RateLimitedSpotify:
+    """Wraps a spotipy client so every API call takes a token from the bucket and retries 429s after Retry-After."""
+
+    def __init__(self, sp, bucket, stats, max_retries=5):
+        self.sp = sp
+        self.bucket = bucket
+        self.stats = stats
+        self.max_retries = max_retries
+
+    def __getattr__(self, name):
+        method = getattr(self.sp, name)
+
+        def call(*args, **kwargs):
+            return self.call(method, *args, **kwargs)
+
+        return call
+
+    def call(self, method, *args, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            self.stats.request_started()
+            try:
+                return method(*args, **kwargs)
+            except SpotifyException as e:
+                if e.http_status != 429 or attempt == self.max_retries:
+                    raise
+                retry_after = float((e.headers or {}).get('Retry-After', 1))
+            finally:
+                self.stats.request_finished()
+
+            self.stats.backed_off(retry_after)
+            self.bucket.pause(retry_after)
+
+
+class SpotifyFetcher:
+    """Pulls audio features, albums and artists through Spotify's bulk endpoints.
+
+    Album and artist lookups are memoized for the life of the fetcher, so one
+    fetcher per sync makes a number of calls that depends on the unique
+    albums/artists rather than on the number of tracks. When given a thread
+    pool, playlist pages and metadata batches are fetched in parallel. When
+    given a store (see ingest.MetadataStore), albums and artists it already
+    holds fresh copies of are not fetched at all.
+    """
+
+    def __init__(self, sp, pool=None, store=None):
+        self.sp = sp
+        self.pool = pool
+        self.store = store
+        self.albums = {}
+        self.artists = {}
+
+    def map(self, func, items):
+        """Runs `func` over `items` on the pool if there is one, keeping the order of `items`."""
+        if self.pool is None:
+            return [func(item) for item in items]
+        return list(self.pool.map(func, items))
+
+    def user_playlists(self, username):
+        """Returns every playlist owned by `username`, following the listing's pages."""
+        playlists = []
+        page = self.sp.user_playlists(username, limit=PLAYLISTS_PAGE_SIZE)
+        while page:
+            playlists.extend(playlist for playlist in page['items'] if playlist['owner']['id'] == username)
+            page = self.sp.next(page) if page['next'] else None
+
+        return playlists
+
+    def playlist_page(self, page):
+        playlist_id, offset = page
+        return self.sp.playlist_items(playlist_id, fields=PLAYLIST_ITEM_FIELDS, limit=PLAYLIST_PAGE_SIZE, offset=offset)
+
+    def playlist_tracks(self, playlist_ids):
+        """Returns a dict of playlist id -> track dicts.
+
+        The first page of every playlist is fetched in parallel, which gives the
+        totals needed to fetch all of the remaining pages in parallel as well.
+        """
+        first = [(playlist_id, 0) for playlist_id in playlist_ids]
+        first_pages = self.map(self.playlist_page, first)
+        rest = [
+            (playlist_id, offset)
+            for playlist_id, first_page in zip(playlist_ids, first_pages)
+            for offset in range(PLAYLIST_PAGE_SIZE, first_page['total'], PLAYLIST_PAGE_SIZE)
+        ]
+        rest_pages = self.map(self.playlist_page, rest)
+
+        tracks = {playlist_id: [] for playlist_id in playlist_ids}
+        for (playlist_id, _), page in zip(first + rest, first_pages + rest_pages):
+            tracks[playlist_id].extend(
+                item['track'] for item in page['items']
+                if item['track'] and item['track'].get('type', 'track') == 'track'
+            )
+
+        return tracks
+
+    def audio_features(self, track_ids):
+        """Returns a dict of track id -> audio features, 100 ids per call."""
+        features = {}
+        for batch in self.map(self.sp.audio_features, list(chunked(track_ids, AUDIO_FEATURES_BATCH_SIZE))):
+            for audio_feature in batch:
+                if audio_feature:  # Spotify returns null for tracks without analysis
+                    features[audio_feature['id']] = audio_feature
+
+        return features
+
+    def load_albums(self, album_ids):
+        """Fetches any albums not already memoized or in the store, 20 ids per call."""
+        missing = [album_id for album_id in dict.fromkeys(album_ids) if album_id and album_id not in self.albums]
+        if self.store is not None:
+            self.albums.update(self.store.albums(missing))
+            missing = [album_id for album_id in missing if album_id not in self.albums]
+
+        fetched = {}
+        for batch in self.map(self.sp.albums, list(chunked(missing, ALBUMS_BATCH_SIZE))):
+            for album in batch['albums']:
+                if album:
+                    fetched[album['id']] = {'name': album['name'], 'release_date': album['release_date']}
+
+        self.albums.update(fetched)
+        if self.store is not None and fetched:
+            self.store.save_albums(fetched)
+
+    def load_artists(self, artist_ids):
+        """Fetches any artists not already memoized or in the store, 50 ids per call."""
+        missing = [artist_id for artist_id in dict.fromkeys(artist_ids) if artist_id and artist_id not in self.artists]
+        if self.store is not None:
+            self.artists.update(self.store.artists(missing))
+            missing = [artist_id for artist_id in missing if artist_id not in self.artists]
+
+        fetched = {}
+        for batch in self.map(self.sp.artists, list(chunked(missing, ARTISTS_BATCH_SIZE))):
+            for artist in batch['artists']:
+                if artist:
+                    fetched[artist['id']] = {
+                        'name': artist['name'],
+                        'popularity': artist['popularity'],
+                        'genres': clean_genres(artist['genres'])
+                    }
+
+        self.artists.update(fetched)
+        if self.store is not None and fetched:
+            self.store.save_artists(fetched)
+
+    def enrich(self, tracks):
+        """Merges audio features, album release date and artist popularity/genres into each track dict."""
+        features = self.audio_features([track['id'] for track in tracks])
+        self.load_albums(track['album']['id'] for track in tracks)
+        self.load_artists(track['artists'][0]['id'] for track in tracks)
+
+        enriched = []
+        for track in tracks:
+            audio_feature = features.get(track['id'])
+            album = self.albums.get(track['album']['id'])
+            artist = self.artists.get(track['artists'][0]['id'])
+
+            if not audio_feature or not album or not artist:
+                continue
+
+            enriched.append({
+                **track,
+                **audio_feature,
+                'release_date': album['release_date'],
+                'popularity': artist['popularity'],
+                'genres': artist['genres']
+            })
+
+        return enriched
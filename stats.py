@@ -0,0 +1,159 @@
+from collections import Counter
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, Tracks, TrackGenres, UserStats, UserTracks
+from queries import feature_moments, top_genres, top_values, year_counts
+from spotify import chunked
+
+# Audio features compared in the correlation heatmap, user_stats keeps their running sums and cross products
+HEATMAP_FEATURES = ['popularity', 'danceability', 'energy', 'loudness', 'speechiness', 'acousticness', 'instrumentalness', 'liveness', 'valence']
+
+STATS_BATCH_SIZE = 500
+
+
+def empty_stats(user_id):
+    size = len(HEATMAP_FEATURES)
+    return {
+        'user_id': user_id,
+        'song_count': 0,
+        'artist_counts': {},
+        'album_counts': {},
+        'genre_counts': {},
+        'year_counts': {},
+        'feature_n': 0,
+        'feature_sums': [0.0] * size,
+        'feature_products': [[0.0] * size for _ in range(size)],
+        'data_version': 0,
+        'updated_at': datetime.utcnow()
+    }
+
+
+def locked_user_stats(user_id):
+    """The user's stats row, locked until the end of the transaction so concurrent syncs queue up, and whether it was just created empty."""
+    dialect = db.session.get_bind().dialect.name
+    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    created = db.session.connection().execute(insert(UserStats.__table__).values(**empty_stats(user_id)).on_conflict_do_nothing()).rowcount
+
+    return db.session.query(UserStats).filter_by(user_id=user_id).with_for_update().populate_existing().one(), bool(created)
+
+
+def library_track_ids(user_id):
+    return [track_id for track_id, in db.session.query(UserTracks.track_id).filter(UserTracks.user_id == user_id)]
+
+
+def merge_counts(counts, values):
+    """A copy of the JSON `counts` with one more for each of `values`, a new dict so the change is saved."""
+    merged = Counter(counts)
+    merged.update(str(value) for value in values if value is not None)
+    return dict(merged)
+
+
+def add_tracks(user_id, track_ids):
+    """Folds tracks newly linked to the user into their stats, in the current transaction.
+
+    When the user has no stats row yet, e.g. their library predates
+    user_stats, it is created from their whole library instead.
+    """
+    if not track_ids:
+        return
+
+    stats, created = locked_user_stats(user_id)
+    if created:
+        track_ids = library_track_ids(user_id)
+    sums = np.array(stats.feature_sums)
+    products = np.array(stats.feature_products)
+
+    for batch in chunked(track_ids, STATS_BATCH_SIZE):
+        columns = [Tracks.artist, Tracks.album, Tracks.release_year] + [getattr(Tracks, feature) for feature in HEATMAP_FEATURES]
+        rows = db.session.query(*columns).filter(Tracks.id.in_(batch)).all()
+        genres = [genre for genre, in db.session.query(TrackGenres.genre).filter(TrackGenres.track_id.in_(batch))]
+
+        stats.song_count += len(rows)
+        stats.artist_counts = merge_counts(stats.artist_counts, (row.artist for row in rows))
+        stats.album_counts = merge_counts(stats.album_counts, (row.album for row in rows))
+        stats.year_counts = merge_counts(stats.year_counts, (row.release_year for row in rows))
+        stats.genre_counts = merge_counts(stats.genre_counts, genres)
+
+        # Only songs with every feature set count towards the means and covariances
+        features = np.array([row[3:] for row in rows], dtype=float).reshape(len(rows), len(HEATMAP_FEATURES))
+        features = features[~np.isnan(features).any(axis=1)]
+        stats.feature_n += len(features)
+        sums += features.sum(axis=0)
+        products += features.T @ features
+
+    stats.feature_sums = sums.tolist()
+    stats.feature_products = products.tolist()
+    stats.data_version += 1
+    stats.updated_at = datetime.utcnow()
+
+
+def rebuild_user_stats(user_id):
+    """Recomputes the user's stats from their whole library, in the current transaction."""
+    stats, _ = locked_user_stats(user_id)
+    data_version = stats.data_version
+    for key, value in empty_stats(user_id).items():
+        setattr(stats, key, value)
+    stats.data_version = data_version + 1
+
+    add_tracks(user_id, library_track_ids(user_id))
+
+
+def queried_stats(user_id):
+    """An unsaved UserStats for a user without a stats row, counted with GROUP BY queries over their library."""
+    feature_n, feature_sums, feature_products = feature_moments(user_id, HEATMAP_FEATURES)
+    return UserStats(
+        user_id=user_id,
+        song_count=db.session.query(UserTracks).filter(UserTracks.user_id == user_id).count(),
+        artist_counts={str(artist): count for artist, count in top_values(user_id, Tracks.artist, None) if artist is not None},
+        album_counts={str(album): count for album, count in top_values(user_id, Tracks.album, None) if album is not None},
+        genre_counts=dict(top_genres(user_id, None)),
+        year_counts={str(year): count for year, count in year_counts(user_id)},
+        feature_n=feature_n,
+        feature_sums=feature_sums,
+        feature_products=feature_products,
+        data_version=0
+    )
+
+
+def user_stats(user_id):
+    """The user's stats row. Nothing is written here: a user without one gets an unsaved row from queried_stats.
+
+    The row is created by the first sync that adds songs, or for every user by `flask rebuild-stats`.
+    """
+    stats = db.session.get(UserStats, user_id)
+    return stats if stats is not None else queried_stats(user_id)
+
+
+def data_version(user_id):
+    """Version of the user's stats, bumped by every change to their library. 0 until they have a stats row."""
+    return db.session.query(UserStats.data_version).filter(UserStats.user_id == user_id).scalar() or 0
+
+
+def top_counts(counts, limit=10):
+    """The `limit` largest entries of a stats counts dict as (value, count), largest first."""
+    return sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+
+def correlation_matrix(stats):
+    """Pearson correlations between the HEATMAP_FEATURES from the running sums and cross products, in O(features²).
+
+    Only songs with every feature set count, as in add_tracks. Features that
+    never vary correlate as nan.
+    """
+    n = stats.feature_n
+    if not n:
+        return np.full((len(HEATMAP_FEATURES), len(HEATMAP_FEATURES)), np.nan)
+
+    sums = np.array(stats.feature_sums)
+    covariance = np.array(stats.feature_products) - np.outer(sums, sums) / n
+    deviations = np.sqrt(np.diag(covariance))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.clip(covariance / np.outer(deviations, deviations), -1, 1)
+
+
+def year_histogram(stats):
+    """(release year, song count) for every year in the user's library, oldest first."""
+    return sorted((int(year), count) for year, count in stats.year_counts.items())
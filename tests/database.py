@@ -0,0 +1,45 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from flask import Flask
+
+from models import db, User
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.py')
+
+
+class DatabaseTestCase(TestCase):
+    """Runs each test in an app context on a fresh in-memory SQLite database, with snapshots in a temporary directory."""
+
+    def setUp(self):
+        self.snapshot_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.snapshot_dir, True)
+
+        self.app = Flask(__name__)
+        self.app.config.from_pyfile(CONFIG_PATH)
+        self.app.config.update(
+            SQLALCHEMY_DATABASE_URI='sqlite://',
+            TESTING=True,
+            SNAPSHOT_DIR=self.snapshot_dir,
+            FIGURE_CACHE_BACKEND='memory',
+            FIGURE_BUILD_PROCESSES=0
+        )
+        db.init_app(self.app)
+
+        self.context = self.app.app_context()
+        self.context.push()
+        self.addCleanup(self.context.pop)
+
+        db.create_all()
+        self.addCleanup(db.drop_all)
+        self.addCleanup(db.session.remove)
+
+    def make_user(self, username='testuser'):
+        user = User(
+            first_name='Test', last_name='User', username=username, email=f'{username}@test.com', password='HASHED_PASSWORD'
+        )
+        db.session.add(user)
+        db.session.commit()
+        return user
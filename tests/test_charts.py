@@ -0,0 +1,103 @@
+import json
+from datetime import date
+from unittest import TestCase
+
+import numpy as np
+from flask import Flask
+
+from charts import VIZ_BUILDERS, Viz, build_figure_json, create_loudness_by_genre_plot, get_figure, load_figure_data
+from loader import link_tracks, load_tracks
+from models import db, UserStats
+from stats import add_tracks
+
+from tests.database import DatabaseTestCase
+
+FEATURES = ['popularity', 'danceability', 'energy', 'loudness', 'speechiness', 'acousticness', 'instrumentalness', 'liveness', 'valence']
+
+
+class VizRegistryTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+
+        load_tracks([
+            {
+                'spotify_id': f'track{n}', 'name': f'Song {n}', 'artist': f'Artist {n % 3}', 'album': f'Album {n % 4}',
+                'genres': ['pop', 'rock,pop', 'jazz'][n % 3], 'release_date': f'{2000 + n % 5}-01-01',
+                'release_date_parsed': date(2000 + n % 5, 1, 1), 'release_year': 2000 + n % 5,
+                **{feature: (n * 7 + i) % 10 / 10 for i, feature in enumerate(FEATURES)}
+            }
+            for n in range(12)
+        ])
+        track_ids = link_tracks(self.user.user_id, [f'track{n}' for n in range(12)])
+        add_tracks(self.user.user_id, track_ids)
+        db.session.commit()
+
+    def test_registered_builders(self):
+        for key, viz in VIZ_BUILDERS.items():
+            self.assertIsInstance(viz, Viz)
+            self.assertEqual(viz.key, key)
+            self.assertIsInstance(viz.columns, tuple)
+            self.assertIn(viz.executor, ('thread', 'process'))
+
+    def test_load_figure_data_has_one_argument_per_source(self):
+        songs, stats = load_figure_data(VIZ_BUILDERS['energy_loudness'], self.user.user_id)
+
+        self.assertEqual(sorted(songs), ['energy', 'loudness', 'name'])
+        self.assertEqual(len(songs['name']), 12)
+        self.assertIsInstance(stats, UserStats)
+        self.assertEqual(stats.song_count, 12)
+
+        songs, = load_figure_data(VIZ_BUILDERS['loudness_by_genre'], self.user.user_id)
+        self.assertEqual(list(songs['genres']), ['pop', 'jazz', 'rock'])
+
+    def test_every_viz_builds(self):
+        for key in VIZ_BUILDERS:
+            with self.subTest(key):
+                stored = []
+                figure = build_figure_json(key, self.user.user_id, stored.append)
+
+                self.assertEqual(stored, [figure])
+                self.assertTrue(json.loads(figure)['data'])
+
+    def test_unknown_viz(self):
+        self.assertIsNone(get_figure('none', self.user.user_id))
+
+
+class LoudnessByGenreTestCase(TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config.update(LOUDNESS_GENRE_LIMIT=20, LARGE_LIBRARY_THRESHOLD=20000, LARGE_LIBRARY_MAX_POINTS=5)
+        context = self.app.app_context()
+        context.push()
+        self.addCleanup(context.pop)
+
+    def songs(self, loudness):
+        """Every song in one genre, 'pop'."""
+        return {
+            'loudness': np.array(loudness, dtype=float),
+            'genres': np.array(['pop']),
+            'genre_offsets': np.array([0, len(loudness)]),
+            'genre_rows': np.arange(len(loudness))
+        }
+
+    def test_boxes_are_computed_on_the_server(self):
+        fig = create_loudness_by_genre_plot(self.songs([-1, -2, -3, -4, -5, -6, -7, -8, -40]))
+        box, outliers = fig.data
+
+        self.assertIsNone(box.y)
+        self.assertEqual((box.q1, box.median, box.q3), ((-7,), (-5,), (-3,)))
+        self.assertEqual(outliers.type, 'scatter')
+        self.assertEqual(list(outliers.y), [-40])
+
+    def test_outliers_of_large_libraries_are_sampled(self):
+        self.app.config.update(LARGE_LIBRARY_THRESHOLD=10)
+
+        fig = create_loudness_by_genre_plot(self.songs(np.concatenate([np.zeros(100), np.linspace(50, 60, 20)])))
+        box, outliers = fig.data
+
+        self.assertEqual((box.lowerfence, box.upperfence), ((0,), (0,)))
+        self.assertEqual(outliers.type, 'scattergl')
+        self.assertLessEqual(len(outliers.y), 5)
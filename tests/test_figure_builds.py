@@ -0,0 +1,126 @@
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from unittest import TestCase, mock
+
+import plotly.graph_objects as go
+from flask import Flask
+
+import charts
+from charts import Viz, get_figure, get_figures, precompute_figures
+
+
+def build_indicator(value):
+    return go.Figure(go.Indicator(mode="number", value=value))
+
+
+def build_slowly(value):
+    time.sleep(0.3)
+    return build_indicator(value)
+
+
+def build_failing(value):
+    raise RuntimeError('no data')
+
+
+class BrokenPool:
+    """Stands in for a process pool whose workers have died."""
+
+    def submit(self, *args):
+        future = Future()
+        future.set_exception(BrokenProcessPool('A child process terminated abruptly'))
+        return future
+
+
+class FigureBuildTestCase(TestCase):
+    """Sets up an app with stand-in vizzes whose data is always [7]."""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config.update(
+            FIGURE_CACHE_BACKEND='memory', FIGURE_BUILD_THREADS=4, FIGURE_BUILD_PROCESSES=0, FIGURE_BUILD_TIMEOUT=0.1
+        )
+        self.context = self.app.app_context()
+        self.context.push()
+        self.addCleanup(self.context.pop)
+
+        builders = {
+            key: Viz(key, build, 'songs', (), executor)
+            for key, build, executor in [
+                ('ok', build_indicator, 'thread'),
+                ('slow', build_slowly, 'thread'),
+                ('failing', build_failing, 'thread'),
+                ('in_process', build_indicator, 'process'),
+                ('slow_in_process', build_slowly, 'process')
+            ]
+        }
+        for target, value in [
+            ('charts.VIZ_BUILDERS', builders),
+            ('charts.data_version', lambda user_id: 1),
+            ('charts.load_figure_data', lambda viz, user_id: [7]),
+        ]:
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        # Every test gets a user of its own in the process-wide figure cache
+        self.user_id = self.id()
+
+
+class GetFiguresTestCase(FigureBuildTestCase):
+
+    def test_builds_every_figure(self):
+        figures = get_figures(['ok'], self.user_id)
+
+        self.assertEqual(figures['ok']['data'][0]['value'], 7)
+
+    def test_failing_chart_is_a_placeholder(self):
+        with self.assertLogs(self.app.logger, level='ERROR'):
+            figures = get_figures(['ok', 'failing'], self.user_id)
+
+        self.assertEqual(figures['ok']['data'][0]['value'], 7)
+        self.assertEqual(figures['failing']['layout']['annotations'][0]['text'], "This chart couldn't be built")
+
+    def test_slow_chart_is_a_placeholder_and_still_cached(self):
+        with self.assertLogs(self.app.logger, level='WARNING'):
+            figures = get_figures(['slow'], self.user_id)
+
+        self.assertIn('still being built', figures['slow']['layout']['annotations'][0]['text'])
+
+        time.sleep(0.5)
+        self.assertIsNotNone(charts.figure_cache().get((self.user_id, 'slow', 1)))
+
+    def test_broken_process_pool_builds_on_the_thread(self):
+        pool = BrokenPool()
+
+        with mock.patch('charts.get_process_pool', return_value=pool), \
+                mock.patch('charts.reset_process_pool') as reset_process_pool, \
+                self.assertLogs(self.app.logger, level='ERROR'):
+            figures = get_figures(['in_process'], self.user_id)
+
+        self.assertEqual(figures['in_process']['data'][0]['value'], 7)
+        reset_process_pool.assert_called_once_with(pool)
+
+    def test_figure_without_deadline_waits_for_the_build_process(self):
+        pool = ThreadPoolExecutor(1)
+        self.addCleanup(pool.shutdown)
+
+        with mock.patch('charts.get_process_pool', return_value=pool), \
+                mock.patch('charts.run_in_app_context', lambda func, *args: func(*args)):
+            figure = get_figure('slow_in_process', self.user_id)
+
+        self.assertEqual(figure['data'][0]['value'], 7)
+
+
+class PrecomputeFiguresTestCase(FigureBuildTestCase):
+
+    def test_failing_figure_doesnt_stop_the_rest(self):
+        progress = {}
+
+        with self.assertLogs(self.app.logger, level='ERROR'):
+            result = precompute_figures(progress.update, self.user_id)
+
+        self.assertEqual(result['failed'], ['failing'])
+        self.assertEqual(result['figures'], 4)
+        self.assertEqual(progress['figures_done'], 5)
+        self.assertIsNotNone(charts.figure_cache().get((self.user_id, 'slow_in_process', 1)))
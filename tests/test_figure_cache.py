@@ -0,0 +1,78 @@
+import tempfile
+from unittest import TestCase
+
+from figure_cache import DiskFigureCache, InProcessFigureCache
+
+
+class InProcessFigureCacheTestCase(TestCase):
+
+    def test_lru_eviction_and_counters(self):
+        cache = InProcessFigureCache(max_entries=2)
+        cache.set((1, "heatmap", 1), "a")
+        cache.set((1, "genres", 1), "b")
+
+        # Reading the heatmap makes genres the least recently used entry
+        self.assertEqual(cache.get((1, "heatmap", 1)), "a")
+        cache.set((2, "heatmap", 1), "c")
+
+        self.assertIsNone(cache.get((1, "genres", 1)))
+        self.assertEqual(cache.as_dict()["hits"], 1)
+        self.assertEqual(cache.as_dict()["misses"], 1)
+        self.assertEqual(cache.as_dict()["evictions"], 1)
+
+    def test_new_data_version_replaces_old_figure(self):
+        cache = InProcessFigureCache()
+        cache.set((1, "heatmap", 1), "old")
+        cache.set((1, "heatmap", 2), "new")
+
+        self.assertIsNone(cache.get((1, "heatmap", 1)))
+        self.assertEqual(cache.get((1, "heatmap", 2)), "new")
+        self.assertEqual(cache.as_dict()["entries"], 1)
+
+    def test_invalidate_user(self):
+        cache = InProcessFigureCache()
+        cache.set((1, "heatmap", 1), "a")
+        cache.set((2, "heatmap", 1), "b")
+
+        cache.invalidate_user(1)
+
+        self.assertIsNone(cache.get((1, "heatmap", 1)))
+        self.assertEqual(cache.get((2, "heatmap", 1)), "b")
+
+    def test_ttl(self):
+        cache = InProcessFigureCache(ttl=0.01)
+        cache.set((1, "heatmap", 1), "a")
+        cache.entries[(1, "heatmap", 1)] = ("a", 0)
+
+        self.assertIsNone(cache.get((1, "heatmap", 1)))
+
+
+class DiskFigureCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_shared_between_instances(self):
+        """Two workers pointed at the same directory see each other's figures."""
+        DiskFigureCache(self.dir.name).set((1, "heatmap", 1), "a")
+        cache = DiskFigureCache(self.dir.name)
+
+        self.assertEqual(cache.get((1, "heatmap", 1)), "a")
+
+        cache.set((1, "heatmap", 2), "b")
+        self.assertIsNone(cache.get((1, "heatmap", 1)))
+        self.assertEqual(cache.as_dict()["entries"], 1)
+
+        cache.invalidate_user(1)
+        self.assertIsNone(cache.get((1, "heatmap", 2)))
+
+    def test_evicts_beyond_max_entries(self):
+        cache = DiskFigureCache(self.dir.name, max_entries=2)
+        for user_id in range(3):
+            cache.set((user_id, "heatmap", 1), "a")
+
+        self.assertEqual(cache.as_dict()["entries"], 2)
+        self.assertEqual(cache.as_dict()["evictions"], 1)
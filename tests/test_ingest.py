@@ -0,0 +1,170 @@
+from datetime import date
+from unittest import TestCase, mock
+
+from ingest import backfill_release_dates, parse_release_date, sync_user_tracks
+from loader import load_tracks
+from models import db, PlaylistSnapshots, Tracks, UserTracks
+
+from tests.database import DatabaseTestCase
+
+
+def make_item(n):
+    return {'track': {
+        'id': f'track{n}', 'name': f'Song {n}', 'type': 'track',
+        'album': {'id': f'album{n % 3}', 'name': f'Album {n % 3}'},
+        'artists': [{'id': f'artist{n % 2}', 'name': f'Artist {n % 2}'}]
+    }}
+
+
+class FakeSpotify:
+    """Stands in for spotipy.Spotify, serving `playlists` (playlist id -> (snapshot id, track numbers)) of one user."""
+
+    def __init__(self, username, playlists):
+        self.username = username
+        self.playlists = playlists
+        self.pages_read = []
+
+    def user_playlists(self, username, limit=50):
+        items = [
+            {'id': playlist_id, 'name': playlist_id, 'snapshot_id': snapshot_id, 'owner': {'id': self.username}}
+            for playlist_id, (snapshot_id, numbers) in self.playlists.items()
+        ]
+        return {'items': items, 'next': None}
+
+    def playlist_items(self, playlist_id, fields=None, limit=100, offset=0):
+        self.pages_read.append((playlist_id, offset))
+        numbers = self.playlists[playlist_id][1]
+        return {'items': [make_item(n) for n in numbers[offset:offset + limit]], 'total': len(numbers)}
+
+    def audio_features(self, ids):
+        return [{
+            'id': track_id, 'acousticness': 0.1, 'analysis_url': 'url', 'danceability': 0.5, 'duration_ms': 200000,
+            'energy': 0.7, 'instrumentalness': 0.0, 'key': 2, 'liveness': 0.1, 'loudness': -6.0, 'mode': 1,
+            'speechiness': 0.05, 'tempo': 120.0, 'time_signature': 4, 'track_href': 'href', 'type': 'audio_features',
+            'uri': f'spotify:track:{track_id}', 'valence': 0.4
+        } for track_id in ids]
+
+    def albums(self, ids):
+        return {'albums': [{'id': album_id, 'name': f'Album {album_id}', 'release_date': '2017-11-12'} for album_id in ids]}
+
+    def artists(self, ids):
+        return {'artists': [{'id': artist_id, 'name': f'Artist {artist_id}', 'popularity': 60, 'genres': ['pop']} for artist_id in ids]}
+
+
+class ReleaseDateTestCase(TestCase):
+
+    def test_parse_release_date(self):
+        self.assertEqual(parse_release_date('2017-11-12'), (date(2017, 11, 12), 2017, 'day'))
+        self.assertEqual(parse_release_date('2005-03'), (date(2005, 3, 1), 2005, 'month'))
+        self.assertEqual(parse_release_date('1999'), (date(1999, 1, 1), 1999, 'year'))
+
+    def test_unparseable_release_dates(self):
+        for release_date in ['0000', '', None, '2017-13-01', 'soon']:
+            self.assertEqual(parse_release_date(release_date), (None, None, None))
+
+
+class BackfillReleaseDatesTestCase(DatabaseTestCase):
+
+    def test_backfill_fills_parsed_columns(self):
+        release_dates = ['2017-11-12', '2005-03', '0000', '1999', None]
+        load_tracks([
+            {'spotify_id': f'track{n}', 'name': f'Song {n}', 'artist': 'Artist', 'release_date': release_date}
+            for n, release_date in enumerate(release_dates)
+        ])
+        db.session.commit()
+
+        self.assertEqual(backfill_release_dates(batch_size=2), 4)
+        self.assertEqual(backfill_release_dates(batch_size=2), 1)  # only the unparseable one is still unfilled
+
+        tracks = {track.spotify_id: track for track in Tracks.query}
+        self.assertEqual((tracks['track0'].release_date_parsed, tracks['track0'].release_date_precision), (date(2017, 11, 12), 'day'))
+        self.assertEqual((tracks['track1'].release_year, tracks['track1'].release_date_precision), (2005, 'month'))
+        self.assertEqual((tracks['track3'].release_year, tracks['track3'].release_date_precision), (1999, 'year'))
+        self.assertIsNone(tracks['track2'].release_year)
+        self.assertIsNone(tracks['track4'].release_year)
+
+
+class SyncUserTracksTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.app.config.update(PRECOMPUTE_FIGURES=False)
+        self.user = self.make_user()
+        self.sp = FakeSpotify(self.user.username, {'mix': ('snap1', list(range(5))), 'chill': ('snap1', list(range(3, 8)))})
+
+    def sync(self, updates=None):
+        progress = {}
+
+        def record(**values):
+            progress.update(values)
+            if updates is not None:
+                updates.append(values)
+
+        with mock.patch('ingest.get_spotify_client', return_value=self.sp):
+            result = sync_user_tracks(record, self.user.user_id)
+        return result, progress
+
+    def test_unchanged_playlists_are_skipped(self):
+        result, progress = self.sync()
+        self.assertEqual(result['rows_inserted'], 8)
+        self.assertEqual(progress['playlists_skipped'], 0)
+        self.assertEqual(
+            {(snapshot.playlist_id, snapshot.snapshot_id) for snapshot in PlaylistSnapshots.query},
+            {('mix', 'snap1'), ('chill', 'snap1')}
+        )
+
+        # Only the playlist whose snapshot changed is read again
+        self.sp.pages_read.clear()
+        self.sp.playlists['chill'] = ('snap2', list(range(3, 10)))
+        result, progress = self.sync()
+
+        self.assertEqual(self.sp.pages_read, [('chill', 0)])
+        self.assertEqual(progress['playlists_skipped'], 1)
+        self.assertEqual(result['rows_inserted'], 2)
+        self.assertEqual(UserTracks.query.filter_by(user_id=self.user.user_id).count(), 10)
+        self.assertEqual(PlaylistSnapshots.query.filter_by(playlist_id='chill').one().snapshot_id, 'snap2')
+
+    def test_commits_a_chunk_at_a_time(self):
+        self.app.config.update(INGEST_CHUNK_SIZE=3, INGEST_PLAYLIST_WINDOW=1)
+        updates = []
+        self.sync(updates)
+
+        self.assertEqual([update['rows_inserted'] for update in updates if 'spotify' in update], [3, 5, 8])
+        self.assertEqual([update['playlists_done'] for update in updates if 'spotify' in update], [0, 1, 2])
+
+    def test_failed_sync_keeps_committed_chunks(self):
+        self.app.config.update(INGEST_CHUNK_SIZE=3, INGEST_PLAYLIST_WINDOW=1)
+        audio_features = self.sp.audio_features
+        self.sp.audio_features = mock.Mock(side_effect=[audio_features(['track0', 'track1', 'track2']), RuntimeError('Spotify is down')])
+
+        with self.assertRaises(RuntimeError):
+            self.sync()
+        db.session.rollback()
+
+        self.assertEqual(UserTracks.query.filter_by(user_id=self.user.user_id).count(), 3)
+        self.assertEqual(PlaylistSnapshots.query.count(), 0)
+
+    def test_precompute_is_queued_when_songs_were_added(self):
+        self.app.config.update(PRECOMPUTE_FIGURES=True)
+        job_queue = self.app.extensions['job_queue'] = mock.Mock()
+        job_queue.enqueue.return_value = 'job1'
+
+        result, _ = self.sync()
+
+        self.assertEqual(result['precompute_job_id'], 'job1')
+        job_queue.enqueue.assert_called_once_with('precompute_figures', self.user.user_id, owner=self.user.user_id)
+
+        # Nothing new to precompute
+        job_queue.reset_mock()
+        result, _ = self.sync()
+        self.assertIsNone(result['precompute_job_id'])
+        job_queue.enqueue.assert_not_called()
+
+    def test_precompute_can_be_turned_off(self):
+        job_queue = self.app.extensions['job_queue'] = mock.Mock()
+
+        result, _ = self.sync()
+
+        self.assertEqual(result['rows_inserted'], 8)
+        self.assertIsNone(result['precompute_job_id'])
+        job_queue.enqueue.assert_not_called()
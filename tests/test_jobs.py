@@ -0,0 +1,59 @@
+from unittest import TestCase
+
+from flask import Flask
+
+from jobs import InProcessJobQueue, make_job_queue, register_job
+
+
+@register_job
+def count_to(progress, n):
+    for i in range(1, n + 1):
+        progress(counted=i)
+    return {'message': f'Counted to {n}'}
+
+
+@register_job
+def always_fails(progress):
+    raise RuntimeError('Spotify is down')
+
+
+class InProcessJobQueueTestCase(TestCase):
+
+    def setUp(self):
+        self.queue = InProcessJobQueue(Flask(__name__))
+
+    def test_job_reports_progress_and_result(self):
+        job_id = self.queue.enqueue('count_to', 3, owner=1)
+        self.queue.join()
+
+        job = self.queue.status(job_id)
+        self.assertEqual(job['status'], 'finished')
+        self.assertEqual(job['owner'], 1)
+        self.assertEqual(job['progress'], {'counted': 3})
+        self.assertEqual(job['result'], {'message': 'Counted to 3'})
+
+    def test_failed_job_records_error(self):
+        job_id = self.queue.enqueue('always_fails')
+        self.queue.join()
+
+        job = self.queue.status(job_id)
+        self.assertEqual(job['status'], 'failed')
+        self.assertEqual(job['error'], 'Spotify is down')
+
+    def test_unknown_job(self):
+        with self.assertRaises(ValueError):
+            self.queue.enqueue('not_a_job')
+        self.assertIsNone(self.queue.status('missing'))
+
+
+class MakeJobQueueTestCase(TestCase):
+
+    def test_warns_about_in_process_queue_outside_debug(self):
+        app = Flask(__name__)
+        with self.assertLogs(app.logger, level='WARNING'):
+            self.assertIsInstance(make_job_queue(app), InProcessJobQueue)
+
+        app = Flask(__name__)
+        app.testing = True
+        with self.assertNoLogs(app.logger, level='WARNING'):
+            make_job_queue(app)
@@ -0,0 +1,55 @@
+from loader import insert_tracks_sqlite, load_genres, load_tracks, split_genres
+from models import db, TrackGenres, Tracks
+
+from tests.database import DatabaseTestCase
+
+
+def track_row(n, **values):
+    return {'spotify_id': f'track{n}', 'name': f'Song {n}', 'artist': f'Artist {n}', 'genres': 'pop', **values}
+
+
+class LoadTracksTestCase(DatabaseTestCase):
+
+    def test_load_skips_cataloged_tracks(self):
+        self.assertEqual(load_tracks([track_row(1), track_row(2)]), 2)
+        self.assertEqual(load_tracks([track_row(2, name='Renamed'), track_row(3)]), 1)
+        db.session.commit()
+
+        self.assertEqual(Tracks.query.count(), 3)
+        self.assertEqual(Tracks.query.filter_by(spotify_id='track2').one().name, 'Song 2')
+
+    def test_load_is_idempotent(self):
+        rows = [track_row(n) for n in range(5)]
+        load_tracks(rows)
+
+        self.assertEqual(load_tracks(rows), 0)
+        self.assertEqual(load_tracks([]), 0)
+        self.assertEqual(Tracks.query.count(), 5)
+
+    def test_insert_tracks_sqlite_counts_new_rows(self):
+        self.assertEqual(insert_tracks_sqlite([track_row(1), track_row(2)]), 2)
+        self.assertEqual(insert_tracks_sqlite([track_row(1), track_row(2), track_row(3)]), 1)
+
+        # Columns missing from a row are stored as NULL
+        self.assertIsNone(Tracks.query.filter_by(spotify_id='track3').one().energy)
+
+
+class GenresTestCase(DatabaseTestCase):
+
+    def test_split_genres(self):
+        self.assertEqual(split_genres('dance pop,pop,,dance pop'), ['dance pop', 'pop'])
+        self.assertEqual(split_genres(''), [])
+        self.assertEqual(split_genres(None), [])
+
+    def test_load_tracks_writes_genres(self):
+        load_tracks([track_row(1, genres='dance pop,pop'), track_row(2, genres=None)])
+
+        genres = db.session.query(Tracks.spotify_id, TrackGenres.genre).join(TrackGenres, TrackGenres.track_id == Tracks.id)
+        self.assertEqual(sorted(genres), [('track1', 'dance pop'), ('track1', 'pop')])
+
+    def test_load_genres_skips_uncataloged_and_existing(self):
+        load_tracks([track_row(1)])
+
+        load_genres([track_row(1, genres='pop,rock'), track_row(9, genres='jazz')])
+
+        self.assertEqual(sorted(genre.genre for genre in TrackGenres.query), ['pop', 'rock'])
@@ -0,0 +1,52 @@
+from sqlalchemy import text
+
+from migrations import LEGACY_TRACK_COLUMNS, MIGRATIONS, upgrade
+from models import db, TrackGenres, Tracks, UserTracks
+
+from tests.database import DatabaseTestCase
+
+
+class UpgradeTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(self.drop_table, 'schema_migrations')
+
+    def drop_table(self, name):
+        with db.engine.begin() as connection:
+            connection.execute(text(f"DROP TABLE IF EXISTS {name}"))
+
+    def recorded(self):
+        with db.engine.connect() as connection:
+            return [name for name, in connection.execute(text("SELECT name FROM schema_migrations ORDER BY name"))]
+
+    def test_upgrade_is_idempotent(self):
+        names = [func.__name__ for func in MIGRATIONS]
+
+        self.assertEqual(upgrade(), names)
+        self.assertEqual(self.recorded(), sorted(names))
+
+        self.assertEqual(upgrade(), [])
+        self.assertEqual(self.recorded(), sorted(names))
+
+    def test_upgrade_moves_legacy_songs(self):
+        user = self.make_user()
+        self.addCleanup(self.drop_table, 'songs')
+
+        columns = ", ".join(f"{column} VARCHAR" for column in LEGACY_TRACK_COLUMNS)
+        with db.engine.begin() as connection:
+            connection.execute(text(f"CREATE TABLE songs (id INTEGER PRIMARY KEY, user_id INTEGER, played_at TIMESTAMP, {columns})"))
+            connection.execute(
+                text("INSERT INTO songs (user_id, spotify_id, name, artist, genres) VALUES (:user_id, :spotify_id, :name, 'Artist', 'pop,rock')"),
+                [
+                    {'user_id': user.user_id, 'spotify_id': 'track1', 'name': 'Song 1'},
+                    {'user_id': user.user_id, 'spotify_id': 'track1', 'name': 'Song 1'},
+                    {'user_id': user.user_id, 'spotify_id': 'track2', 'name': 'Song 2'}
+                ]
+            )
+
+        upgrade()
+
+        self.assertEqual(sorted(track.spotify_id for track in Tracks.query), ['track1', 'track2'])
+        self.assertEqual(UserTracks.query.filter_by(user_id=user.user_id).count(), 2)
+        self.assertEqual(TrackGenres.query.count(), 4)
@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+from unittest import TestCase
+
+import numpy as np
+
+from regression import fit_features, fit_sums
+from stats import HEATMAP_FEATURES
+
+
+class RegressionTestCase(TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.x = rng.uniform(0, 1, 500)
+        self.y = -12 + 8 * self.x + rng.normal(0, 1.5, 500)
+
+    def assertMatchesPolyfit(self, fit):
+        slope, intercept, r_squared = fit
+        expected_slope, expected_intercept = np.polyfit(self.x, self.y, 1)
+
+        self.assertAlmostEqual(slope, expected_slope)
+        self.assertAlmostEqual(intercept, expected_intercept)
+        self.assertAlmostEqual(r_squared, np.corrcoef(self.x, self.y)[0, 1] ** 2)
+
+    def test_matches_polyfit(self):
+        x, y = self.x, self.y
+        self.assertMatchesPolyfit(fit_sums(len(x), x.sum(), y.sum(), x @ x, x @ y, y @ y))
+
+    def test_degenerate(self):
+        self.assertIsNone(fit_sums(1, 1, 1, 1, 1, 1))
+        self.assertIsNone(fit_sums(3, 1.5, 6, 0.75, 3, 14))  # x is always 0.5
+
+    def test_fit_from_user_stats_sums(self):
+        """Running sums folded in two batches give the same line as fitting every point at once."""
+        features = np.zeros((500, len(HEATMAP_FEATURES)))
+        features[:, HEATMAP_FEATURES.index('energy')] = self.x
+        features[:, HEATMAP_FEATURES.index('loudness')] = self.y
+        first, second = features[:200], features[200:]
+        stats = SimpleNamespace(
+            feature_n=500,
+            feature_sums=(first.sum(axis=0) + second.sum(axis=0)).tolist(),
+            feature_products=(first.T @ first + second.T @ second).tolist()
+        )
+
+        self.assertMatchesPolyfit(fit_features(stats, 'energy', 'loudness'))
@@ -0,0 +1,37 @@
+from unittest import TestCase
+
+import numpy as np
+
+from sampling import box_stats, quantiles, stratified_sample
+
+
+class SamplingTestCase(TestCase):
+
+    def test_stratified_sample_keeps_sparse_regions(self):
+        rng = np.random.default_rng(0)
+        x = np.append(rng.normal(0, 1, 50000), [40.0, np.nan])
+        y = np.append(rng.normal(0, 1, 50000), [40.0, 1.0])
+
+        sample = stratified_sample(x, y, 1000)
+
+        self.assertLessEqual(len(sample), 1000)
+        self.assertIn(50000, sample)
+        self.assertNotIn(50001, sample)
+        np.testing.assert_array_equal(sample, stratified_sample(x, y, 1000))
+
+    def test_small_scatters_are_not_sampled(self):
+        np.testing.assert_array_equal(stratified_sample([1, 2, 3], [1, 2, 3], 1000), [0, 1, 2])
+
+    def test_box_stats(self):
+        box = box_stats([1, 2, 3, 4, 5, 6, 7, 8, 100, np.nan])
+
+        self.assertEqual((box['q1'], box['median'], box['q3']), (3, 5, 7))
+        self.assertEqual((box['lowerfence'], box['upperfence']), (1, 8))
+        np.testing.assert_array_equal(box['outliers'], [100])
+        self.assertIsNone(box_stats([np.nan]))
+
+    def test_quantiles_match_numpy(self):
+        values = np.random.default_rng(0).normal(size=1001)
+
+        np.testing.assert_allclose(quantiles(values, [0, 0.25, 0.5, 0.75, 1]), np.quantile(values, [0, 0.25, 0.5, 0.75, 1]))
+        np.testing.assert_allclose(quantiles(np.array([3.0, 1.0]), [0.25, 0.5]), [1.5, 2.0])
@@ -0,0 +1,50 @@
+import os
+
+from loader import link_tracks, load_tracks
+from models import db
+from snapshots import invalidate_snapshot, snapshot_dir, user_snapshot
+
+from tests.database import DatabaseTestCase
+
+
+class UserSnapshotTestCase(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.add_songs(range(3))
+
+    def add_songs(self, numbers):
+        spotify_ids = [f'track{n}' for n in numbers]
+        load_tracks([
+            {'spotify_id': spotify_id, 'name': f'Song {spotify_id}', 'artist': 'Artist', 'energy': 0.5, 'genres': 'pop'}
+            for spotify_id in spotify_ids
+        ])
+        link_tracks(self.user.user_id, spotify_ids)
+        db.session.commit()
+
+    def test_snapshot_is_built_once(self):
+        snapshot = user_snapshot(self.user.user_id)
+        self.assertEqual(sorted(snapshot['name']), ['Song track0', 'Song track1', 'Song track2'])
+        self.assertEqual(list(snapshot['genres']), ['pop'])
+
+        mtime = os.stat(os.path.join(snapshot_dir(self.user.user_id), 'name.npy')).st_mtime_ns
+        user_snapshot(self.user.user_id)
+        self.assertEqual(os.stat(os.path.join(snapshot_dir(self.user.user_id), 'name.npy')).st_mtime_ns, mtime)
+
+    def test_snapshot_is_rebuilt_when_the_library_size_differs(self):
+        user_snapshot(self.user.user_id)
+
+        # Linked without invalidating, as when a sync commits between an invalidation and a rebuild
+        self.add_songs([3])
+
+        self.assertEqual(len(user_snapshot(self.user.user_id)['name']), 4)
+
+    def test_invalidate_snapshot_drops_it(self):
+        user_snapshot(self.user.user_id)
+
+        invalidate_snapshot(self.user.user_id)
+
+        self.assertFalse(os.path.exists(snapshot_dir(self.user.user_id)))
+        self.assertEqual(os.listdir(self.snapshot_dir), [])
+        invalidate_snapshot(self.user.user_id)  # nothing left to drop
@@ -0,0 +1,166 @@
+import io
+from unittest import TestCase, mock
+
+import requests
+from urllib3 import HTTPResponse
+from spotipy import SpotifyException
+
+import spotify
+from spotify import SharedClientCredentials, SpotifyFetcher, RateLimitedSpotify, SyncStats, TokenBucket, chunked, get_spotify_client, make_session
+
+
+def make_track(n, album_id, artist_id):
+    return {
+        "id": f"track{n}",
+        "name": f"Track {n}",
+        "album": {"id": album_id, "name": f"Album {album_id}"},
+        "artists": [{"id": artist_id, "name": f"Artist {artist_id}"}]
+    }
+
+
+class FakeSpotify:
+    """Stands in for spotipy.Spotify and counts calls to the bulk endpoints."""
+
+    def __init__(self):
+        self.calls = {"audio_features": 0, "albums": 0, "artists": 0}
+
+    def audio_features(self, ids):
+        self.calls["audio_features"] += 1
+        assert len(ids) <= 100
+        return [{"id": track_id, "energy": 0.5, "type": "audio_features"} for track_id in ids]
+
+    def albums(self, ids):
+        self.calls["albums"] += 1
+        assert len(ids) <= 20
+        return {"albums": [{"id": album_id, "name": f"Album {album_id}", "release_date": "2017-11-12"} for album_id in ids]}
+
+    def artists(self, ids):
+        self.calls["artists"] += 1
+        assert len(ids) <= 50
+        return {"artists": [{"id": artist_id, "name": f"Artist {artist_id}", "popularity": 78, "genres": ["dance pop", "{pop}"]} for artist_id in ids]}
+
+
+class SpotifyFetcherTestCase(TestCase):
+
+    def test_chunked(self):
+        self.assertEqual(list(chunked(range(5), 2)), [[0, 1], [2, 3], [4]])
+
+    def test_calls_scale_with_unique_entities(self):
+        """250 tracks over 3 albums and 2 artists should need 3 + 1 + 1 calls."""
+        sp = FakeSpotify()
+        fetcher = SpotifyFetcher(sp)
+        tracks = [make_track(n, f"album{n % 3}", f"artist{n % 2}") for n in range(250)]
+
+        enriched = fetcher.enrich(tracks)
+
+        self.assertEqual(len(enriched), 250)
+        self.assertEqual(sp.calls, {"audio_features": 3, "albums": 1, "artists": 1})
+        self.assertEqual(enriched[0]["genres"], "dance pop,pop")
+        self.assertEqual(enriched[0]["release_date"], "2017-11-12")
+
+        # A second batch in the same sync reuses the memoized albums and artists
+        fetcher.enrich([make_track(300, "album0", "artist1")])
+        self.assertEqual(sp.calls, {"audio_features": 4, "albums": 1, "artists": 1})
+
+
+class RateLimitedSpotifyTestCase(TestCase):
+
+    def test_retries_after_429(self):
+        """A 429 pauses the shared bucket for Retry-After seconds and the call is retried."""
+        responses = [SpotifyException(429, -1, "Too many requests", headers={"Retry-After": "0.05"}), {"albums": []}]
+
+        class ThrottledSpotify:
+            def albums(self, ids):
+                response = responses.pop(0)
+                if isinstance(response, Exception):
+                    raise response
+                return response
+
+        stats = SyncStats()
+        sp = RateLimitedSpotify(ThrottledSpotify(), TokenBucket(100), stats)
+
+        self.assertEqual(sp.albums(["album0"]), {"albums": []})
+        self.assertEqual(stats.as_dict()["requests"], 2)
+        self.assertEqual(stats.as_dict()["throttled"], 1)
+        self.assertAlmostEqual(stats.as_dict()["backoff_seconds"], 0.05)
+
+    def test_other_errors_are_raised(self):
+        class MissingSpotify:
+            def albums(self, ids):
+                raise SpotifyException(404, -1, "Not found")
+
+        sp = RateLimitedSpotify(MissingSpotify(), TokenBucket(100), SyncStats())
+
+        with self.assertRaises(SpotifyException):
+            sp.albums(["album0"])
+
+
+class MakeSessionTestCase(TestCase):
+
+    def get(self, status, headers):
+        """GETs through make_session's adapter with every response from the server replaced by `status`, returns the response and the number of requests sent."""
+        def make_request(conn, method, url, **kwargs):
+            return HTTPResponse(body=io.BytesIO(b'{}'), status=status, headers=headers, preload_content=False)
+
+        with mock.patch('urllib3.connectionpool.HTTPConnectionPool._make_request', side_effect=make_request) as sent, \
+                mock.patch('time.sleep'):
+            response = make_session(2).get('https://api.spotify.com/v1/albums')
+        return response, sent.call_count
+
+    def test_429_is_left_to_rate_limiter(self):
+        response, sent = self.get(429, {'Retry-After': '5'})
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(sent, 1)
+
+    def test_server_errors_are_retried(self):
+        with self.assertRaises(requests.exceptions.RetryError):
+            self.get(503, {'Retry-After': '5'})
+
+
+class SharedClientCredentialsTestCase(TestCase):
+
+    def test_token_is_reused_until_close_to_expiry(self):
+        class TokenResponse:
+            def raise_for_status(self):
+                pass
+
+            def json(self):
+                return {"access_token": f"token{len(session.posts)}", "expires_in": 3600}
+
+        class FakeSession(requests.Session):
+            def __init__(self):
+                super().__init__()
+                self.posts = []
+
+            def post(self, url, **kwargs):
+                self.posts.append(url)
+                return TokenResponse()
+
+        session = FakeSession()
+        auth_manager = SharedClientCredentials("id", "secret", session, refresh_margin=300)
+
+        self.assertEqual(auth_manager.get_access_token(), "token1")
+        self.assertEqual(auth_manager.get_access_token(), "token1")
+        self.assertEqual(len(session.posts), 1)
+
+        # Inside the refresh margin the token is replaced before it actually expires
+        auth_manager.refresh_margin = 3600
+        self.assertEqual(auth_manager.get_access_token(), "token2")
+        self.assertEqual(len(session.posts), 2)
+
+
+class GetSpotifyClientTestCase(TestCase):
+
+    def setUp(self):
+        spotify._client = None
+        self.addCleanup(setattr, spotify, '_client', None)
+
+    def test_transport_session_is_made_once(self):
+        config = {'SPOTIFY_POOL_SIZE': 4, 'SPOTIFY_TOKEN_REFRESH_MARGIN': 300, 'SPOTIFY_TRANSPORT': 'live'}
+
+        with mock.patch('spotify.make_transport_session', return_value=None) as make_transport_session:
+            client = get_spotify_client('id', 'secret', config)
+            self.assertIs(get_spotify_client('id', 'secret', config), client)
+
+        make_transport_session.assert_called_once_with(config)
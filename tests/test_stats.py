@@ -0,0 +1,25 @@
+from types import SimpleNamespace
+from unittest import TestCase
+
+import numpy as np
+
+from stats import HEATMAP_FEATURES, correlation_matrix
+
+
+class CorrelationMatrixTestCase(TestCase):
+
+    def test_matches_numpy(self):
+        features = np.random.default_rng(0).normal(size=(300, len(HEATMAP_FEATURES)))
+        stats = SimpleNamespace(
+            feature_n=len(features),
+            feature_sums=features.sum(axis=0).tolist(),
+            feature_products=(features.T @ features).tolist()
+        )
+
+        np.testing.assert_allclose(correlation_matrix(stats), np.corrcoef(features, rowvar=False), atol=1e-12)
+
+    def test_empty_library(self):
+        size = len(HEATMAP_FEATURES)
+        stats = SimpleNamespace(feature_n=0, feature_sums=[0.0] * size, feature_products=[[0.0] * size] * size)
+
+        self.assertTrue(np.isnan(correlation_matrix(stats)).all())
@@ -0,0 +1,52 @@
+import json
+import shutil
+import tempfile
+from unittest import TestCase
+
+import spotipy
+
+from spotify import RateLimitedSpotify, SharedClientCredentials, SyncStats, TokenBucket, make_session
+from transport import ReplaySession, fixture_path, request_key
+
+ALBUM_URL = "https://api.spotify.com/v1/albums/"
+
+
+class ReplaySessionTestCase(TestCase):
+
+    def setUp(self):
+        self.fixtures_dir = tempfile.mkdtemp()
+        key = request_key("GET", ALBUM_URL, {"ids": "album0"})
+        with open(fixture_path(self.fixtures_dir, key), "w") as f:
+            json.dump({"status": 200, "body": {"albums": [{"id": "album0", "release_date": "2017-11-12"}]}}, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.fixtures_dir)
+
+    def make_client(self, session):
+        session = make_session(2, session)
+        return spotipy.Spotify(auth_manager=SharedClientCredentials("id", "secret", session), requests_session=session)
+
+    def test_replays_recorded_response(self):
+        session = ReplaySession(self.fixtures_dir)
+        sp = self.make_client(session)
+
+        self.assertEqual(sp.albums(["album0"])["albums"][0]["release_date"], "2017-11-12")
+        self.assertEqual(session.calls["/v1/albums/"], 1)
+
+    def test_missing_fixture(self):
+        sp = self.make_client(ReplaySession(self.fixtures_dir))
+
+        with self.assertRaises(LookupError):
+            sp.albums(["album1"])
+
+    def test_injected_429s_are_retried(self):
+        session = ReplaySession(self.fixtures_dir, throttle_rate=0.5, retry_after=0, seed=3)
+        stats = SyncStats()
+        sp = RateLimitedSpotify(self.make_client(session), TokenBucket(1000), stats, max_retries=20)
+
+        for _ in range(10):
+            self.assertEqual(sp.albums(["album0"])["albums"][0]["id"], "album0")
+
+        self.assertGreater(stats.as_dict()["throttled"], 0)
+        self.assertEqual(stats.as_dict()["requests"], 10 + stats.as_dict()["throttled"])
+        self.assertEqual(session.calls["/v1/albums/"], stats.as_dict()["requests"])
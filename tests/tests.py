@@ -1,7 +1,7 @@
 from unittest import TestCase
 # from sqlalchemy import exc
 
-from models import db, User, Songs
+from models import db, User, Tracks, UserTracks
 from app import app, CURR_USER_KEY
 
 app.config['SQLALCHEMY_DATABASE_URI'] = "postgresql:///datalens-test"
@@ -12,11 +12,10 @@ app.config['TESTING'] = True
 db.drop_all()
 db.create_all()
 
-SONG_DATA = {
-    "id": "37",	
+TRACK_DATA = {
     "acousticness":	"0.398",
     "album": "Havana (Remix)",
-    "analysis_ur": "https://api.spotify.com/v1/audio-analysis/3whrwq4DtvucphBPUogRuJ",	
+    "analysis_url": "https://api.spotify.com/v1/audio-analysis/3whrwq4DtvucphBPUogRuJ",	
     "artist": "Camila Cabello",	
     "popularity": "78",	
     "danceability":	"0.751",
@@ -37,9 +36,7 @@ SONG_DATA = {
     "spotify_type":	"audio_features",
     "uri": "spotify:track:3whrwq4DtvucphBPUogRuJ",
     "valence": "0.349",
-    "genres": "dance pop,pop",	
-    "played_at": "",	
-    "user_id": "1"
+    "genres": "dance pop,pop"
 }
 
 
@@ -59,11 +56,13 @@ class DataLensTestCase(TestCase):
         
         self.client = app.test_client()
         
-        song = Songs(**SONG_DATA)
-        db.session.add(song)
+        track = Tracks(**TRACK_DATA)
+        db.session.add(track)
+        db.session.flush()
+        db.session.add(UserTracks(user_id=self.uid1, track_id=track.id))
         db.session.commit()
         
-        self.song = song
+        self.track = track
 
     def tearDown(self):
         res = super().tearDown()
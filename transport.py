@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlsplit, urlunsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+TOKEN_URL = "https://accounts.spotify.com/api/token"
+
+
+def request_key(method, url, params=None):
+    """Identifies a request by method, URL and query parameters, however the parameters were passed."""
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query) + [(key, str(value)) for key, value in (params or {}).items() if value is not None]
+    base_url = urlunsplit((parts.scheme, parts.netloc, parts.path, '', ''))
+    return method.upper(), base_url, sorted(query)
+
+
+def fixture_path(fixtures_dir, key):
+    method, base_url, query = key
+    digest = hashlib.sha1(json.dumps([method, base_url, query]).encode()).hexdigest()
+    return os.path.join(fixtures_dir, f"{digest}.json")
+
+
+def make_response(url, status, body, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.reason = HTTPStatus(status).phrase
+    response.url = url
+    response.headers = CaseInsensitiveDict(headers or {'Content-Type': 'application/json'})
+    response._content = json.dumps(body).encode()
+    response.encoding = 'utf-8'
+    return response
+
+
+class RecordingSession(requests.Session):
+    """Sends requests to Spotify as usual and saves each API response as a JSON fixture.
+
+    Token exchanges are never written to disk, replay hands out a fake token instead.
+    """
+
+    def __init__(self, fixtures_dir):
+        super().__init__()
+        self.fixtures_dir = fixtures_dir
+        os.makedirs(fixtures_dir, exist_ok=True)
+
+    def request(self, method, url, params=None, **kwargs):
+        response = super().request(method, url, params=params, **kwargs)
+
+        if not url.startswith(TOKEN_URL) and response.status_code != 429:
+            key = request_key(method, url, params)
+            fixture = {
+                'method': key[0],
+                'url': key[1],
+                'query': key[2],
+                'status': response.status_code,
+                'body': response.json() if response.content else None
+            }
+            path = fixture_path(self.fixtures_dir, key)
+            with open(f"{path}.tmp", 'w') as f:
+                json.dump(fixture, f)
+            os.replace(f"{path}.tmp", path)
+
+        return response
+
+
+class ReplaySession(requests.Session):
+    """Answers Spotify requests from recorded fixtures without touching the network.
+
+    `latency` seconds are added to every response, and `throttle_rate` of
+    responses (chosen by a seeded RNG, so runs are repeatable) are replaced by
+    a 429 with a `Retry-After` of `retry_after` seconds. `calls` counts
+    requests per endpoint path.
+    """
+
+    def __init__(self, fixtures_dir, latency=0.0, throttle_rate=0.0, retry_after=1, seed=0):
+        super().__init__()
+        self.fixtures_dir = fixtures_dir
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = Counter()
+
+    def request(self, method, url, params=None, **kwargs):
+        if url.startswith(TOKEN_URL):
+            return make_response(url, 200, {'access_token': 'replay', 'token_type': 'Bearer', 'expires_in': 3600})
+
+        key = request_key(method, url, params)
+        with self.lock:
+            self.calls[urlsplit(key[1]).path] += 1
+            throttled = self.random.random() < self.throttle_rate
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if throttled:
+            return make_response(url, 429, {'error': {'status': 429, 'message': 'API rate limit exceeded'}}, {
+                'Content-Type': 'application/json',
+                'Retry-After': str(self.retry_after)
+            })
+
+        path = fixture_path(self.fixtures_dir, key)
+        if not os.path.exists(path):
+            raise LookupError(f"No recorded response for {key[0]} {key[1]} {key[2]}")
+
+        with open(path) as f:
+            fixture = json.load(f)
+
+        return make_response(url, fixture['status'], fixture['body'])
+
+
+def make_transport_session(config):
+    """Returns the session for SPOTIFY_TRANSPORT ('record' or 'replay'), or None to talk to Spotify directly."""
+    transport = config.get('SPOTIFY_TRANSPORT', 'live')
+
+    if transport == 'record':
+        return RecordingSession(config['SPOTIFY_FIXTURES_DIR'])
+    if transport == 'replay':
+        return ReplaySession(
+            config['SPOTIFY_FIXTURES_DIR'],
+            latency=config['SPOTIFY_REPLAY_LATENCY'],
+            throttle_rate=config['SPOTIFY_REPLAY_429_RATE'],
+            retry_after=config['SPOTIFY_REPLAY_RETRY_AFTER'],
+            seed=config['SPOTIFY_REPLAY_SEED']
+        )
+    if transport != 'live':
+        raise ValueError(f"Unknown SPOTIFY_TRANSPORT: {transport}")
+
+    return None
@@ -0,0 +1,6 @@
+"""Runs queued background jobs from redis: `python worker.py`"""
+from app import job_queue
+
+
+if __name__ == "__main__":
+    job_queue.work()